@@ -0,0 +1,288 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+import metrics
+
+from rollups import RollupCube
+from grid_index import GridLocator
+
+SAFE, WARNING, DANGER = 0, 1, 2
+
+# Chỉ số theo ngày cho mỗi ô lưới: (field, thống kê, hệ số đổi đơn vị)
+ALERT_METRICS = {
+    'min_temp': ('t2m', 'min', 1.0),
+    'max_temp': ('t2m', 'max', 1.0),
+    'total_precip': ('tp', 'sum', 1000.0),  # m -> mm
+    'max_wind': ('wind', 'max', 1.0),
+    'min_pressure': ('msl', 'min', 0.01),  # Pa -> hPa
+    'max_pressure': ('msl', 'max', 0.01),
+}
+
+AlertRule = namedtuple('AlertRule', ['metric', 'op', 'threshold', 'level', 'message', 'recommendations'])
+
+_OPS = {'<': np.less, '>': np.greater}
+
+# Bảng ngưỡng cảnh báo cho nuôi trồng thủy sản
+ALERT_RULES = [
+    AlertRule('min_temp', '<', 16, DANGER,
+              "⚠️ Cảnh báo: Nhiệt độ có thể xuống dưới 16°C - nguy hiểm cho thủy sản!", """
+            **Khuyến nghị:**
+            - Tăng độ sâu ao nuôi lên ít nhất 2m
+            - Che phủ ao bằng bạt hoặc lưới
+            - Giảm 50% lượng thức ăn
+            - Theo dõi sức khỏe thủy sản mỗi 4 giờ
+            - Chuẩn bị hệ thống sưởi dự phòng
+            """),
+    AlertRule('min_temp', '<', 20, WARNING,
+              "⚠️ Lưu ý: Nhiệt độ có thể xuống dưới 20°C - cần theo dõi chặt chẽ", """
+            **Khuyến nghị:**
+            - Theo dõi nhiệt độ nước mỗi 6 giờ
+            - Chuẩn bị phương án che phủ ao
+            - Giảm 30% lượng thức ăn
+            - Tăng cường sục khí
+            """),
+    AlertRule('total_precip', '>', 100, DANGER,
+              "⚠️ Cảnh báo: Lượng mưa rất lớn (>100mm) - nguy hiểm cho ao nuôi", """
+            **Khuyến nghị:**
+            - Kiểm tra và nâng cấp hệ thống thoát nước
+            - Đo pH nước mỗi 4 giờ (duy trì 6.5-8.5)
+            - Ngừng cho ăn trong ngày mưa
+            - Tăng cường sục khí
+            - Theo dõi nồng độ oxy mỗi 2 giờ
+            - Chuẩn bị vôi để điều chỉnh pH
+            """),
+    AlertRule('total_precip', '>', 50, WARNING,
+              "⚠️ Cảnh báo: Lượng mưa lớn có thể ảnh hưởng đến ao nuôi", """
+            **Khuyến nghị:**
+            - Kiểm tra hệ thống thoát nước
+            - Đo pH nước mỗi 6 giờ
+            - Giảm 50% lượng thức ăn
+            - Tăng cường sục khí
+            - Theo dõi nồng độ oxy mỗi 4 giờ
+            """),
+    AlertRule('max_wind', '>', 15, DANGER,
+              "⚠️ Cảnh báo: Gió rất mạnh (>15 m/s) - nguy hiểm cho ao nuôi", """
+            **Khuyến nghị:**
+            - Cố định tất cả thiết bị trên ao
+            - Che chắn ao bằng lưới chắn gió
+            - Ngừng cho ăn trong thời gian gió mạnh
+            - Tăng cường theo dõi chất lượng nước mỗi 4 giờ
+            - Chuẩn bị máy phát điện dự phòng
+            """),
+    AlertRule('max_wind', '>', 10, WARNING,
+              "⚠️ Cảnh báo: Gió mạnh có thể ảnh hưởng đến ao nuôi", """
+            **Khuyến nghị:**
+            - Cố định các thiết bị trên ao
+            - Che chắn ao để tránh bụi và vật lạ
+            - Giảm 50% lượng thức ăn
+            - Tăng cường theo dõi chất lượng nước mỗi 6 giờ
+            """),
+    AlertRule('min_pressure', '<', 990, DANGER,
+              "⚠️ Cảnh báo: Áp suất khí quyển rất thấp (<990 hPa) - nguy hiểm cho thủy sản", """
+            **Khuyến nghị:**
+            - Tăng cường sục khí 24/24
+            - Theo dõi nồng độ oxy mỗi 2 giờ
+            - Giảm 70% mật độ nuôi tạm thời
+            - Ngừng cho ăn
+            - Chuẩn bị máy phát điện dự phòng
+            """),
+    AlertRule('min_pressure', '<', 1000, WARNING,
+              "⚠️ Lưu ý: Áp suất khí quyển thấp có thể ảnh hưởng đến sức khỏe thủy sản", """
+            **Khuyến nghị:**
+            - Tăng cường sục khí
+            - Theo dõi nồng độ oxy mỗi 4 giờ
+            - Giảm 50% mật độ nuôi tạm thời
+            - Giảm 50% lượng thức ăn
+            """),
+]
+
+# Độ lệch chuẩn hóa (z-score) so với chuẩn khí hậu cùng ngày, giờ và ô lưới được coi là bất thường
+ANOMALY_ZSCORE = 2.0
+ANOMALY_MESSAGES = {
+    't2m': "⚠️ Nhiệt độ dự báo khác thường so với cùng kỳ nhiều năm",
+    'tp': "⚠️ Lượng mưa dự báo khác thường so với cùng kỳ nhiều năm",
+    'wind': "⚠️ Gió dự báo khác thường so với cùng kỳ nhiều năm",
+    'msl': "⚠️ Áp suất khí quyển dự báo khác thường so với cùng kỳ nhiều năm",
+}
+
+# Gộp chỉ số của các ô trong một vùng: lấy ô xấu nhất (lạnh nhất, mưa nhiều nhất...)
+REGION_REDUCERS = {'min': 'min', 'max': 'max', 'sum': 'max'}
+
+# Thông báo khi chỉ số có dữ liệu nhưng không vượt ngưỡng nào
+SAFE_MESSAGES = {
+    'min_temp': "✅ Nhiệt độ trong khoảng an toàn cho thủy sản",
+}
+
+
+def add_wind_speed(df):
+    if 'u10' in df.columns and 'v10' in df.columns:
+        df = df.assign(wind=np.sqrt(df['u10'] ** 2 + df['v10'] ** 2))
+    return df
+
+
+def apply_rules(values, rules=ALERT_RULES):
+    """(levels, rule_ids) cho mỗi chỉ số: mức cao nhất trong các luật bị kích hoạt; -1 nghĩa là không có luật nào."""
+    levels = {}
+    rule_ids = {}
+    for name, metric in values.items():
+        levels[name] = np.zeros(np.shape(metric), dtype=np.int8)
+        rule_ids[name] = np.full(np.shape(metric), -1, dtype=np.int16)
+    for rule_id, rule in enumerate(rules):
+        if rule.metric not in values:
+            continue
+        fired = _OPS[rule.op](values[rule.metric], rule.threshold)
+        stronger = fired & (rule.level > levels[rule.metric])
+        levels[rule.metric][stronger] = rule.level
+        rule_ids[rule.metric][stronger] = rule_id
+    return levels, rule_ids
+
+
+class AlertCube:
+    """Chỉ số và mức cảnh báo cho mọi (ngày, lat, lon) của bộ dữ liệu dự báo."""
+
+    def __init__(self, dates, lats, lons, daily_metrics, rules=ALERT_RULES):
+        self.dates = dates
+        self.lats = lats
+        self.lons = lons
+        self.metrics = daily_metrics
+        self.rules = rules
+        self.locator = GridLocator(lats, lons)
+        shape = (len(dates), len(lats), len(lons))
+        self.levels, self.rule_ids = apply_rules(daily_metrics, rules)
+        self.level = np.max(np.stack(list(self.levels.values())), axis=0) if self.levels \
+            else np.zeros(shape, dtype=np.int8)
+
+    def _day(self, date):
+        day = np.datetime64(pd.Timestamp(date).date(), 'D')
+        i = np.searchsorted(self.dates, day)
+        return i if i < len(self.dates) and self.dates[i] == day else None
+
+    def point(self, lat, lon, date, interpolate=False):
+        """{metric: (giá trị, rule hoặc None)} tại một điểm và một ngày; NaN nếu không có dữ liệu.
+
+        Mặc định lấy ô lưới gần nhất; interpolate=True nội suy chỉ số tại đúng tọa độ rồi áp luật.
+        """
+        if interpolate:
+            site = self.sites([lat], [lon], date).iloc[0]
+            return {
+                name: (float(site[name]), self.rules[int(site[f'{name}_rule'])] if site[f'{name}_rule'] >= 0 else None)
+                for name in self.metrics
+            }
+        day, cell = self._day(date), self.locator.cell(lat, lon)
+        result = {}
+        for name, values in self.metrics.items():
+            if day is None or cell is None:
+                result[name] = (np.nan, None)
+                continue
+            rule_id = self.rule_ids[name][day, cell[0], cell[1]]
+            result[name] = (float(values[day, cell[0], cell[1]]), self.rules[rule_id] if rule_id >= 0 else None)
+        return result
+
+    def sites(self, lats, lons, date):
+        """Chỉ số nội suy song tuyến tính và mức cảnh báo tại nhiều tọa độ bất kỳ (vd. các trang trại) trong một ngày.
+
+        Bảng gồm latitude, longitude, level, mỗi chỉ số và cột <chỉ số>_rule (chỉ số luật, -1 nếu không có).
+        """
+        lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+        lons = np.atleast_1d(np.asarray(lons, dtype=np.float64))
+        day = self._day(date)
+        values = {
+            name: (self.locator.interpolate(metric[day], lats, lons) if day is not None
+                   else np.full(len(lats), np.nan))
+            for name, metric in self.metrics.items()
+        }
+        levels, rule_ids = apply_rules(values, self.rules)
+        result = pd.DataFrame({'latitude': lats, 'longitude': lons})
+        result['level'] = np.max(np.stack(list(levels.values())), axis=0) if levels \
+            else np.zeros(len(lats), dtype=np.int8)
+        for name in self.metrics:
+            result[name] = values[name]
+            result[f'{name}_rule'] = rule_ids[name]
+        return result
+
+    def day_levels(self, date):
+        """Lưới mức cảnh báo tổng hợp (lat, lon) của một ngày."""
+        day = self._day(date)
+        if day is None:
+            return np.zeros((len(self.lats), len(self.lons)), dtype=np.int8)
+        return self.level[day]
+
+    def to_frame(self, min_level=WARNING):
+        """Bảng (date, latitude, longitude, level) của các ô có cảnh báo, dùng cho xuất/gửi thông báo."""
+        d, i, j = np.nonzero(self.level >= min_level)
+        return pd.DataFrame({
+            'date': pd.DatetimeIndex(self.dates[d]).date,
+            'latitude': self.lats[i],
+            'longitude': self.lons[j],
+            'level': self.level[d, i, j],
+        })
+
+
+def anomaly_alerts(joined, threshold=ANOMALY_ZSCORE):
+    """{field: z-score lệch xa nhất} của các trường vượt ngưỡng, từ frame đã Climatology.join."""
+    result = {}
+    for field in ANOMALY_MESSAGES:
+        column = f'{field}_zscore'
+        if column not in joined.columns:
+            continue
+        zscores = joined[column].to_numpy()
+        if np.isnan(zscores).all():
+            continue
+        worst = zscores[np.nanargmax(np.abs(zscores))]
+        if abs(worst) >= threshold:
+            result[field] = float(worst)
+    return result
+
+
+@metrics.timed('compare_regions')
+def compare_regions(df, rules=ALERT_RULES):
+    """Chỉ số ngày và mức cảnh báo của nhiều vùng trong một lần tính trên frame đã nối (cột region).
+
+    Chỉ số được tính theo (vùng, ngày, ô lưới) rồi lấy ô xấu nhất của vùng. Bảng gồm region, date,
+    level, cells_alerted (số ô có cảnh báo), mỗi chỉ số và cột <chỉ số>_level.
+    """
+    df = add_wind_speed(df)
+    names = [name for name, (field, _, _) in ALERT_METRICS.items() if field in df.columns]
+    region = df['region'].astype('category')
+    day = df['time'].to_numpy().astype('datetime64[D]')
+    grouped = df.groupby([region.cat.codes.to_numpy(), day, df['latitude'].to_numpy(), df['longitude'].to_numpy()])
+    cells = {}
+    for name in names:
+        field, stat, scale = ALERT_METRICS[name]
+        values = grouped[field].sum(min_count=1) if stat == 'sum' else grouped[field].agg(stat)
+        cells[name] = values * scale
+    cells = pd.DataFrame(cells)
+    levels, _ = apply_rules({name: cells[name].to_numpy() for name in names}, rules)
+    for name in names:
+        cells[f'{name}_level'] = levels[name]
+    cells['level'] = np.max(np.stack(list(levels.values())), axis=0) if levels else np.zeros(len(cells), dtype=np.int8)
+    cells['cells_alerted'] = cells['level'] >= WARNING
+
+    by_region = cells.groupby(level=[0, 1])
+    summary = by_region.agg({
+        'level': 'max', 'cells_alerted': 'sum',
+        **{name: REGION_REDUCERS[ALERT_METRICS[name][1]] for name in names},
+        **{f'{name}_level': 'max' for name in names},
+    })
+    codes, days = summary.index.get_level_values(0), summary.index.get_level_values(1)
+    summary = summary.reset_index(drop=True)
+    summary.insert(0, 'region', pd.Categorical.from_codes(codes, categories=region.cat.categories))
+    summary.insert(1, 'date', pd.DatetimeIndex(days).date)
+    return summary
+
+
+@metrics.timed('evaluate_alerts')
+def evaluate_alerts(df, rules=ALERT_RULES):
+    """Tính mức cảnh báo cho toàn bộ lưới và mọi ngày dự báo trong một lượt."""
+    df = add_wind_speed(df)
+    fields = sorted({field for field, _, _ in ALERT_METRICS.values() if field in df.columns})
+    cube = RollupCube.from_frame(df, 'D', fields)
+    daily_metrics = {
+        name: cube.array(field, stat) * scale
+        for name, (field, stat, scale) in ALERT_METRICS.items()
+        if field in fields
+    }
+    dates = (np.arange(cube.n_buckets) + cube.origin).astype('datetime64[D]')
+    return AlertCube(dates, cube.lats, cube.lons, daily_metrics, rules)
@@ -1,12 +1,29 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 import os
-from datetime import datetime
+import time
+import urllib.error
+from datetime import datetime, date
 import locale
 import calendar
 
+import data_store
+from grid_index import GridIndex, GridSlices
+from forecast_store import ForecastWatcher, run_issue_time
+import rollups
+import alerts
+import charts
+from lod import LodSeries
+from query_service import QueryClient
+import metrics
+import support_store
+import regions
+
+# Đo thời gian cả lần rerun và các span bên trong
+rerun_start = time.perf_counter()
+metrics.REGISTRY.start_trace()
+
 st.set_page_config(layout="wide")
 
 # Set Vietnamese locale
@@ -21,6 +38,22 @@ except:
 # Đường dẫn file CSV
 HISTORICAL_CSV_PATH = r"C:\Users\DELL\Documents\Zalo Received Files\Truc-quan-hoa-du-lieu\output_from_grib (6).csv"
 FORECAST_CSV_PATH = r"C:\Users\DELL\Documents\Zalo Received Files\Truc-quan-hoa-du-lieu\predictions_hanoi_10d_from_30_4 (1).csv"
+# Thư mục nhận các file dự báo mới (mỗi 6 giờ); để None nếu không cần theo dõi
+FORECAST_WATCH_DIR = os.path.dirname(FORECAST_CSV_PATH)
+FORECAST_WATCH_PATTERN = "predictions_*.csv"
+# Danh sách vùng (file JSON, xem regions.py); để trống thì chỉ có một vùng với các file ở trên
+REGIONS_FILE = os.environ.get("WEATHER_REGIONS")
+REGIONS = regions.load_regions(REGIONS_FILE) if REGIONS_FILE else [regions.Region(
+    regions.DEFAULT_REGION, 'Hà Nội', HISTORICAL_CSV_PATH, FORECAST_CSV_PATH, FORECAST_WATCH_DIR, FORECAST_WATCH_PATTERN)]
+# Dump tin nhắn hỗ trợ (MySQL) đi kèm repo, được nạp vào SQLite ở lần mở đầu tiên
+SUPPORT_SQL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "insert_support_message.sql")
+# Địa chỉ query_service.py (vd. http://127.0.0.1:8765); để trống thì app tự truy vấn dữ liệu
+QUERY_SERVICE_URL = os.environ.get("WEATHER_QUERY_URL")
+# Vùng mà query_service.py phục vụ (tham số --region của nó)
+QUERY_SERVICE_REGION = os.environ.get("WEATHER_QUERY_REGION", REGIONS[0].key)
+# File metrics định dạng Prometheus (vd. cho node_exporter textfile collector), mỗi tiến trình ghi
+# một file <tên>.<pid><đuôi>, nhãn pid; để trống thì không ghi
+METRICS_TEXTFILE = os.environ.get("WEATHER_METRICS_FILE")
 
 # Custom CSS for sidebar
 st.markdown("""
@@ -81,9 +114,12 @@ with st.sidebar:
     st.markdown('<div class="sidebar-section">', unsafe_allow_html=True)
     section = st.radio(
         "Select Analysis Type",
-        ["Yearly Analysis", "Monthly Analysis", "Daily Analysis", "Weather Forecast"],
+        ["Yearly Analysis", "Monthly Analysis", "Daily Analysis", "Trend Analysis", "Grid Map", "Support Messages",
+         "Weather Forecast", "Region Comparison"],
         label_visibility="collapsed"
     )
+    # Vùng đang xem; chỉ hiện khi có nhiều vùng
+    region = st.selectbox("Region", REGIONS, format_func=lambda r: r.name) if len(REGIONS) > 1 else REGIONS[0]
     st.markdown('</div>', unsafe_allow_html=True)
     
     # Add some spacing
@@ -99,63 +135,137 @@ with st.sidebar:
     - Interactive visualizations
     """)
     st.markdown('</div>', unsafe_allow_html=True)
+    show_debug = st.checkbox("Show performance panel", value=False)
 
-# Đọc dữ liệu lịch sử
-@st.cache_data
-def load_historical_data():
-    df = pd.read_csv(HISTORICAL_CSV_PATH)
-    df['time'] = pd.to_datetime(df['time'])
-    df['date'] = df['time'].dt.date
-    df['hour'] = df['time'].dt.hour
-    df['month'] = df['time'].dt.month
-    df['year'] = df['time'].dt.year
-    df['day_name'] = df['time'].dt.strftime('%A')
-    df['month_name'] = df['time'].dt.strftime('%B')
-    # Convert temperature from Kelvin to Celsius
-    if 't2m' in df.columns:
-        df['t2m'] = df['t2m'] - 273.15
-    return df
-
-# Đọc dữ liệu dự báo
+# Danh sách năm/tháng/ngày và lưới của dữ liệu lịch sử, không cần nạp dữ liệu
 @st.cache_data
-def load_forecast_data():
-    df = pd.read_csv(FORECAST_CSV_PATH)
-    # Rename columns to match historical data format
-    df = df.rename(columns={
-        'lat': 'latitude',
-        'lon': 'longitude',
-        '2m_temperature': 't2m',
-        'mean_sea_level_pressure': 'msl',
-        'total_precipitation_6hr': 'tp',
-        '10m_u_component_of_wind': 'u10',
-        '10m_v_component_of_wind': 'v10'
-    })
-    df['time'] = pd.to_datetime(df['time'])
-    df['date'] = df['time'].dt.date
-    df['hour'] = df['time'].dt.hour
-    df['month'] = df['time'].dt.month
-    df['year'] = df['time'].dt.year
-    df['day_name'] = df['time'].dt.strftime('%A')
-    df['month_name'] = df['time'].dt.strftime('%B')
-    # Convert temperature from Kelvin to Celsius
-    if 't2m' in df.columns:
-        df['t2m'] = df['t2m'] - 273.15
-    return df
-
-# Load both datasets
-historical_df = load_historical_data()
-forecast_df = load_forecast_data()
-
-if section in ["Yearly Analysis", "Monthly Analysis", "Daily Analysis"]:
-    df = historical_df
-    latitude_min, latitude_max = float(df['latitude'].min()), float(df['latitude'].max())
-    longitude_min, longitude_max = float(df['longitude'].min()), float(df['longitude'].max())
+def load_historical_manifest(region):
+    return data_store.historical_manifest(region.historical_csv)
+
+# Chỉ mục (lat, lon) -> khoảng hàng. Dữ liệu lịch sử chỉ nạp phân vùng năm/tháng đang xem.
+# Dùng cache_resource (không pickle/copy): các frame là view trên file Arrow được memory-map,
+# nên mọi session và mọi tiến trình Streamlit dùng chung trang nhớ của hệ điều hành.
+@st.cache_resource(max_entries=16)
+def get_historical_index(region, year, month=None):
+    months = None if month is None else [month]
+    index = GridIndex(data_store.load_historical(region.historical_csv, years=[year], months=months))
+    metrics.REGISTRY.set_gauge('frame_bytes', metrics.frame_memory_bytes(index.frame), region=region.key,
+                               frame=f"historical-{year}" + ("" if month is None else f"-{month:02d}"))
+    return index
+
+# Kho các lượt dự báo của một vùng: mỗi file mới được ingest thành một lượt, không parse lại các lượt cũ
+@st.cache_resource
+def get_forecast_store(region):
+    store = regions.forecast_store(region)
+    if region.forecast_csv and os.path.exists(region.forecast_csv):
+        store.ingest(region.forecast_csv)
+    if region.watch_dir and os.path.isdir(region.watch_dir):
+        watcher = ForecastWatcher(store, region.watch_dir, region.watch_pattern)
+        watcher.poll()
+        watcher.start()
+    return store
+
+# Đọc dữ liệu dự báo của một lượt
+@st.cache_resource(max_entries=8)
+def get_forecast_index(region, run_id):
+    index = GridIndex(get_forecast_store(region).load_run(run_id))
+    metrics.REGISTRY.set_gauge('frame_bytes', metrics.frame_memory_bytes(index.frame), region=region.key,
+                               frame=f"forecast-{run_id}")
+    return index
+
+# Bảng tổng hợp theo tháng/ngày cho từng ô lưới, được tạo sẵn khi ingest
+@st.cache_resource
+def get_historical_rollups(region):
+    return data_store.load_rollups(region.historical_csv)
+
+# Mức cảnh báo nuôi trồng thủy sản cho mọi ô lưới và mọi ngày dự báo
+@st.cache_resource(max_entries=8)
+def get_forecast_alerts(region, run_id):
+    return alerts.evaluate_alerts(get_forecast_index(region, run_id).frame)
+
+# Cảnh báo theo (vùng, ngày) của lượt mới nhất mọi vùng, tính một lần trên frame đã nối;
+# run_ids chỉ dùng làm khóa cache để tính lại khi có lượt mới
+@st.cache_resource(max_entries=4)
+def get_region_comparison(run_ids):
+    return alerts.compare_regions(regions.latest_forecasts(REGIONS))
+
+# Chuỗi thời gian nhiều mức chi tiết (6h/ngày/tuần/tháng) cho các khoảng thời gian dài
+@st.cache_resource
+def get_historical_lod(region):
+    cubes = {freq: data_store.load_rollup(region.historical_csv, freq) for freq in ('D', 'W', 'M')}
+    def load_raw(lat, lon, start, end):
+        return data_store.load_historical(region.historical_csv, start=start, end=end, lat=lat, lon=lon)
+    return LodSeries(cubes, load_raw)
+
+# Lưới dày (time, lat, lon) của một tháng cho bản đồ, dựng từ phân vùng đã nạp
+@st.cache_resource(max_entries=8)
+def get_grid_slices(region, year, month):
+    return GridSlices(get_historical_index(region, year, month), ['t2m', 'tp', 'wind', 'msl'])
+
+# Ảnh bản đồ theo (trường, thời điểm): kéo thanh thời gian chỉ là đọc lại ảnh đã render
+@st.cache_resource
+def get_tile_cache():
+    return charts.ChartCache(charts.TILE_CACHE_SIZE)
+
+# Cơ sở dữ liệu tin nhắn hỗ trợ; chỉ nạp lại khi nội dung dump thay đổi
+@st.cache_resource
+def get_support_db():
+    support_store.import_dump(SUPPORT_SQL_PATH)
+    return support_store.SUPPORT_DB
+
+# Danh sách hội thoại là phép gộp trên cả bảng nên chỉ tính lại mỗi phút
+@st.cache_data(ttl=60)
+def load_support_conversations(db_path):
+    return support_store.conversations(db_path)
+
+# Chuẩn khí hậu (ngày trong năm, giờ, ô lưới) dựng sẵn khi ingest dữ liệu lịch sử
+@st.cache_resource
+def get_store_climatology(store_path):
+    return data_store.store_climatology(store_path)
+
+# Chỉ dùng chuẩn khí hậu khi store lịch sử đã có (section lịch sử hoặc regions.py đã dựng): phiên chỉ
+# xem dự báo không băm hay ingest file lịch sử. Trả về (đường dẫn store, chuẩn khí hậu) hoặc (None, None)
+def get_climatology(region):
+    if not region.historical_csv or not os.path.exists(region.historical_csv):
+        return None, None
+    path = data_store.existing_store_path(region.historical_csv)
+    return (path, get_store_climatology(path)) if path else (None, None)
+
+# Ảnh biểu đồ đã render, dùng chung giữa các session của tiến trình
+@st.cache_resource
+def get_chart_cache():
+    return charts.ChartCache()
+
+chart_cache = get_chart_cache()
+
+def show_chart(png):
+    with metrics.span('st_image', section=section):
+        st.image(png)
+# query_service.py phục vụ một vùng (--region, mặc định vùng đầu tiên); các vùng khác được truy vấn trực tiếp
+query_client = QueryClient(QUERY_SERVICE_URL) if QUERY_SERVICE_URL and region.key == QUERY_SERVICE_REGION else None
+
+def query(remote, local):
+    # Dịch vụ truy vấn không chạy hoặc trả lỗi: tự truy vấn dữ liệu thay vì làm hỏng cả trang
+    if query_client:
+        try:
+            return remote(query_client)
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            st.caption(f"Query service unavailable ({e}); using local data.")
+    return local()
+
+# Dữ liệu chỉ được nạp khi section cần tới; store lịch sử của một vùng được dựng khi section lịch sử
+# đầu tiên mở vùng đó. Ingest trước mọi vùng (song song) bằng CLI: python regions.py regions.json
+if section in ["Yearly Analysis", "Monthly Analysis", "Daily Analysis", "Trend Analysis", "Grid Map"]:
+    manifest = load_historical_manifest(region)
+    historical_version = data_store.source_hash(region.historical_csv)
+    monthly_cube, daily_cube = get_historical_rollups(region)
+    latitude_min, latitude_max = manifest['latitudes'][0], manifest['latitudes'][-1]
+    longitude_min, longitude_max = manifest['longitudes'][0], manifest['longitudes'][-1]
 
 if section == "Yearly Analysis":
     st.markdown("<h1 style='color:#22223b;'>Yearly Weather Data Analysis</h1>", unsafe_allow_html=True)
-    years = sorted(df['year'].unique())
+    years = manifest['years']
     selected_year = st.selectbox('Select Year', years)
-    filtered_df = df[df['year'] == selected_year]
     st.write(f"Selected Year: {selected_year}")
     col1, col2 = st.columns(2)
     with col1:
@@ -163,56 +273,22 @@ if section == "Yearly Analysis":
     with col2:
         lon = st.slider('Select Longitude', min_value=longitude_min, max_value=longitude_max, value=longitude_min, step=0.25, format="%.2f")
 
-    # Lọc dữ liệu theo lat/lon
-    point_df = filtered_df[(filtered_df['latitude'] == lat) & (filtered_df['longitude'] == lon)]
-    if not point_df.empty:
-        # Tính max/min nhiệt độ và tổng lượng mưa theo tháng (tp sang mm)
-        month_stats = point_df.groupby('month').agg({
-            't2m': ['max', 'min'],
-            'tp': 'sum'
-        }).reset_index()
-        month_stats.columns = ['month', 'max_temp', 'min_temp', 'total_precip']
-        month_stats['total_precip'] = month_stats['total_precip'] * 1000  # m -> mm
-        # Nhãn tháng đẹp: T1, T2, ...
-        month_stats['month_label'] = month_stats['month'].apply(lambda x: f"T{x}")
-
+    # Max/min nhiệt độ và tổng lượng mưa theo tháng (tp sang mm), đọc từ bảng tổng hợp
+    month_stats = query(lambda client: client.monthly_stats(lat, lon, selected_year),
+                        lambda: rollups.monthly_stats(monthly_cube, lat, lon, selected_year))
+    if not month_stats.empty:
+        chart_key = ('Yearly Analysis', historical_version, lat, lon, selected_year)
         col1, col2 = st.columns([2,2])
         with col1:
-            fig, ax1 = plt.subplots(figsize=(7,5))
-            ax1.bar(month_stats['month_label'], month_stats['total_precip'], color='dodgerblue', alpha=0.6, label='Total Precipitation')
-            ax1.set_ylabel('Rainfall (mm)', color='dodgerblue')
-            ax1.tick_params(axis='y', labelcolor='dodgerblue')
-            ax1.set_xlabel('Month')
-            ax2 = ax1.twinx()
-            ax2.plot(month_stats['month_label'], month_stats['max_temp'], color='crimson', marker='o', label='Max Temperature')
-            ax2.plot(month_stats['month_label'], month_stats['min_temp'], color='forestgreen', marker='o', label='Min Temperature')
-            ax2.set_ylabel('Temperature (°C)', color='crimson')
-            ax2.tick_params(axis='y', labelcolor='crimson')
-            plt.xticks(month_stats['month_label'])
-            ax1.legend(loc='upper left')
-            ax2.legend(loc='upper right')
-            plt.title('Temperature and Rainfall Analysis by Month')
-            st.pyplot(fig, use_container_width=False)
+            png = chart_cache.get_or_render(chart_key + ('bar',), lambda: charts.rainfall_temperature_chart(
+                month_stats, 'month_label', 'Month', 'Temperature and Rainfall Analysis by Month'))
+            show_chart(png)
         with col2:
             pie_data = month_stats[month_stats['total_precip'] > 0]
             if not pie_data.empty:
-                values = pie_data['total_precip']
-                months = pie_data['month_label']
-                colors = plt.cm.tab20.colors
-                def autopct_func(pct):
-                    return f'{pct:.1f}%' if pct > 7 else ''
-                fig2, ax3 = plt.subplots(figsize=(7,5))
-                wedges, texts, autotexts = ax3.pie(
-                    values,
-                    labels=None,
-                    autopct=autopct_func,
-                    startangle=90,
-                    colors=colors,
-                    textprops={'fontsize': 12, 'weight': 'bold'}
-                )
-                ax3.legend(wedges, months, title="Month", loc="center left", bbox_to_anchor=(1, 0.5), fontsize=11)
-                ax3.set_title('Rainfall Distribution by Month', fontsize=14, weight='bold')
-                st.pyplot(fig2, use_container_width=False)
+                png = chart_cache.get_or_render(chart_key + ('pie',), lambda: charts.rainfall_pie_chart(
+                    pie_data['total_precip'], pie_data['month_label'], "Month", 'Rainfall Distribution by Month'))
+                show_chart(png)
             else:
                 st.info('No rainfall data for this year at the selected location.')
         st.markdown("<div style='height: 80px;'></div>", unsafe_allow_html=True)
@@ -221,11 +297,10 @@ if section == "Yearly Analysis":
         st.markdown("<div style='height: 80px;'></div>", unsafe_allow_html=True)
 elif section == "Monthly Analysis":
     st.markdown("<h1 style='color:#22223b;'>Monthly Weather Data Analysis</h1>", unsafe_allow_html=True)
-    years = sorted(df['year'].unique())
+    years = manifest['years']
     selected_year = st.selectbox('Select Year', years)
-    months = sorted(df[df['year'] == selected_year]['month'].unique())
+    months = manifest['months'][str(selected_year)]
     selected_month = st.selectbox('Select Month', months, format_func=lambda x: f"{x:02d}")
-    filtered_df = df[(df['year'] == selected_year) & (df['month'] == selected_month)]
     st.write(f"Selected Month: {selected_month:02d}/{selected_year}")
     col1, col2 = st.columns(2)
     with col1:
@@ -233,56 +308,22 @@ elif section == "Monthly Analysis":
     with col2:
         lon = st.slider('Select Longitude', min_value=longitude_min, max_value=longitude_max, value=longitude_min, step=0.25, format="%.2f")
 
-    # Lọc dữ liệu theo lat/lon
-    point_df = filtered_df[(filtered_df['latitude'] == lat) & (filtered_df['longitude'] == lon)]
-    if not point_df.empty:
-        # Tính max/min nhiệt độ và tổng lượng mưa theo ngày (tp sang mm)
-        daily_stats = point_df.groupby('date').agg({
-            't2m': ['max', 'min'],
-            'tp': 'sum'
-        }).reset_index()
-        daily_stats.columns = ['date', 'max_temp', 'min_temp', 'total_precip']
-        daily_stats['total_precip'] = daily_stats['total_precip'] * 1000  # m -> mm
-
+    # Max/min nhiệt độ và tổng lượng mưa theo ngày (tp sang mm), đọc từ bảng tổng hợp
+    daily_stats = query(lambda client: client.daily_stats(lat, lon, selected_year, selected_month),
+                        lambda: rollups.daily_stats(daily_cube, lat, lon, selected_year, selected_month))
+    if not daily_stats.empty:
+        chart_key = ('Monthly Analysis', historical_version, lat, lon, selected_year, selected_month)
         col1, col2 = st.columns([2,2])
         with col1:
-            fig, ax1 = plt.subplots(figsize=(7,5))
-            ax1.bar(daily_stats['date'], daily_stats['total_precip'], color='dodgerblue', alpha=0.6, label='Total Precipitation')
-            ax1.set_ylabel('Rainfall (mm)', color='dodgerblue')
-            ax1.tick_params(axis='y', labelcolor='dodgerblue')
-            ax1.set_xlabel('Date')
-            ax2 = ax1.twinx()
-            ax2.plot(daily_stats['date'], daily_stats['max_temp'], color='crimson', marker='o', label='Max Temperature')
-            ax2.plot(daily_stats['date'], daily_stats['min_temp'], color='forestgreen', marker='o', label='Min Temperature')
-            ax2.set_ylabel('Temperature (°C)', color='crimson')
-            ax2.tick_params(axis='y', labelcolor='crimson')
-            fig.autofmt_xdate(rotation=45)
-            ax1.legend(loc='upper left')
-            ax2.legend(loc='upper right')
-            plt.title('Temperature and Rainfall Analysis')
-            st.pyplot(fig, use_container_width=False)
+            png = chart_cache.get_or_render(chart_key + ('bar',), lambda: charts.rainfall_temperature_chart(
+                daily_stats, 'date', 'Date', 'Temperature and Rainfall Analysis', rotate_labels=True))
+            show_chart(png)
         with col2:
             pie_data = daily_stats[daily_stats['total_precip'] > 0]
             if not pie_data.empty:
-                # Pie chart: chỉ hiện % >7%, không label trực tiếp, legend bên cạnh
-                values = pie_data['total_precip']
-                dates = pie_data['date'].astype(str)
-                colors = plt.cm.tab20.colors
-                def autopct_func(pct):
-                    return f'{pct:.1f}%' if pct > 7 else ''
-                fig2, ax3 = plt.subplots(figsize=(7,5))
-                wedges, texts, autotexts = ax3.pie(
-                    values,
-                    labels=None, # Không label trực tiếp
-                    autopct=autopct_func,
-                    startangle=90,
-                    colors=colors,
-                    textprops={'fontsize': 12, 'weight': 'bold'}
-                )
-                # Thêm legend bên cạnh
-                ax3.legend(wedges, dates, title="Date", loc="center left", bbox_to_anchor=(1, 0.5), fontsize=11)
-                ax3.set_title('Rainfall Distribution by Day', fontsize=14, weight='bold')
-                st.pyplot(fig2, use_container_width=False)
+                png = chart_cache.get_or_render(chart_key + ('pie',), lambda: charts.rainfall_pie_chart(
+                    pie_data['total_precip'], pie_data['date'].astype(str), "Date", 'Rainfall Distribution by Day'))
+                show_chart(png)
             else:
                 st.info('No rainfall data for this month at the selected location.')
         # Kéo dài trang cho đẹp
@@ -301,10 +342,10 @@ elif section == "Daily Analysis":
         'V Wind Component': 'v10',
         'Total Precipitation': 'tp'
     }
-    existing_fields = {k: v for k, v in available_fields.items() if v in df.columns}
+    existing_fields = {k: v for k, v in available_fields.items() if v in manifest['columns']}
 
     selected_field = st.selectbox('Select Attribute for Trend', list(existing_fields.keys()))
-    dates = sorted(df['date'].unique())
+    dates = [date.fromisoformat(d) for d in manifest['dates']]
     selected_date = st.selectbox('Select Date', dates, format_func=lambda x: x.strftime('%Y/%m/%d'))
 
     col1, col2 = st.columns(2)
@@ -313,7 +354,8 @@ elif section == "Daily Analysis":
     with col2:
         lon = st.slider('Select Longitude', min_value=longitude_min, max_value=longitude_max, value=longitude_min, step=0.25, format="%.2f")
 
-    df_point = df[(df['date'] == selected_date) & (df['latitude'] == lat) & (df['longitude'] == lon)]
+    index = get_historical_index(region, selected_date.year, selected_date.month)
+    df_point = index.point_date(lat, lon, selected_date)
 
     st.markdown(f"**{selected_field} Trend (6-hourly)**")
     if not df_point.empty:
@@ -323,22 +365,155 @@ elif section == "Daily Analysis":
         # Nếu là trường lượng mưa thì chuyển sang mm
         if existing_fields[selected_field] == 'tp':
             y_data = y_data * 1000
-        fig, ax = plt.subplots(figsize=(8, 4))
-        ax.plot(df_hour['hour'], y_data, marker='o', color='b', linewidth=2, markersize=5)
-        ax.set_xlabel('Hour', fontsize=10)
-        ax.set_ylabel(selected_field + (' (mm)' if existing_fields[selected_field]=='tp' else ''), fontsize=10)
-        ax.set_title(f"{selected_field} Trend on {selected_date}", fontsize=12)
-        ax.tick_params(axis='both', labelsize=9)
-        ax.grid(True)
-        plt.xticks(df_hour['hour'])
+        ylabel = selected_field + (' (mm)' if existing_fields[selected_field]=='tp' else '')
+        png = chart_cache.get_or_render(
+            ('Daily Analysis', historical_version, lat, lon, selected_date, existing_fields[selected_field]),
+            lambda: charts.trend_chart(df_hour['hour'], y_data, ylabel, f"{selected_field} Trend on {selected_date}"))
         col_left, col_center, col_right = st.columns([1,3,1])
         with col_center:
-            st.pyplot(fig, use_container_width=False)
+            show_chart(png)
     else:
         st.warning('No data for this location on selected date.')
-else:
+elif section == "Trend Analysis":
+    st.markdown("<h1 style='color:#22223b;'>Long-term Trend Analysis</h1>", unsafe_allow_html=True)
+
+    trend_fields = {
+        'Temperature (°C)': 't2m',
+        'Mean Sea Level Pressure': 'msl',
+        'U Wind Component': 'u10',
+        'V Wind Component': 'v10',
+        'Total Precipitation': 'tp'
+    }
+    existing_fields = {k: v for k, v in trend_fields.items() if v in manifest['columns']}
+    selected_field = st.selectbox('Select Attribute for Trend', list(existing_fields.keys()))
+    first_date, last_date = date.fromisoformat(manifest['dates'][0]), date.fromisoformat(manifest['dates'][-1])
+    start_date, end_date = st.slider('Select Period', min_value=first_date, max_value=last_date,
+                                     value=(first_date, last_date), format="YYYY/MM/DD")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        lat = st.slider('Select Latitude', min_value=latitude_min, max_value=latitude_max, value=latitude_min, step=0.25, format="%.2f")
+    with col2:
+        lon = st.slider('Select Longitude', min_value=longitude_min, max_value=longitude_max, value=longitude_min, step=0.25, format="%.2f")
+
+    # Mức chi tiết được chọn theo độ dài khoảng thời gian, tối đa vài nghìn điểm mỗi biểu đồ
+    field = existing_fields[selected_field]
+    trend, level = get_historical_lod(region).series(field, lat, lon, pd.Timestamp(start_date),
+                                               pd.Timestamp(end_date) + pd.Timedelta(days=1))
+    if not trend.empty:
+        # Nếu là trường lượng mưa thì chuyển sang mm
+        if field == 'tp':
+            trend[['min', 'max', 'mean']] = trend[['min', 'max', 'mean']] * 1000
+        ylabel = selected_field + (' (mm)' if field == 'tp' else '')
+        png = chart_cache.get_or_render(
+            ('Trend Analysis', historical_version, lat, lon, start_date, end_date, field),
+            lambda: charts.lod_trend_chart(trend, ylabel, f"{selected_field} from {start_date} to {end_date}"))
+        show_chart(png)
+        st.caption(f"{len(trend)} points at {level} resolution")
+    else:
+        st.warning('No data for this location in the selected period.')
+elif section == "Grid Map":
+    st.markdown("<h1 style='color:#22223b;'>Weather Map of the Grid</h1>", unsafe_allow_html=True)
+
+    # Trường trên bản đồ: (trường, cách gộp theo kỳ, hệ số đổi đơn vị, bảng màu)
+    map_fields = {
+        'Temperature (°C)': ('t2m', 'mean', 1, 'coolwarm'),
+        'Total Precipitation (mm)': ('tp', 'sum', 1000, 'Blues'),
+        'Wind Speed (m/s)': ('wind', 'mean', 1, 'viridis'),
+        'Mean Sea Level Pressure (hPa)': ('msl', 'mean', 0.01, 'RdYlBu_r'),
+    }
+    periods = {'6-hourly': '6h', 'Daily': 'D', 'Monthly': 'M'}
+    col1, col2 = st.columns(2)
+    with col1:
+        years = manifest['years']
+        selected_year = st.selectbox('Select Year', years)
+        months = manifest['months'][str(selected_year)]
+        selected_month = st.selectbox('Select Month', months, format_func=lambda x: f"{x:02d}")
+    with col2:
+        slices = get_grid_slices(region, selected_year, selected_month)
+        existing_fields = {k: v for k, v in map_fields.items() if v[0] in slices.fields}
+        selected_field = st.selectbox('Select Attribute', list(existing_fields.keys()))
+        selected_period = st.radio('Aggregate', list(periods.keys()), horizontal=True)
+
+    field, how, scale, cmap = existing_fields[selected_field]
+    freq = periods[selected_period]
+    starts, grids = slices.periods(field, freq, how)
+    time_format = {'6h': '%Y/%m/%d %H:%M', 'D': '%Y/%m/%d', 'M': '%m/%Y'}[freq]
+    labels = list(pd.DatetimeIndex(starts).strftime(time_format))
+    if len(labels) > 1:
+        selected_label = st.select_slider('Select Time', options=labels)
+    else:
+        selected_label = labels[0]
+    step = labels.index(selected_label)
+    vmin, vmax = slices.limits(field, freq, how)
+
+    png = get_tile_cache().get_or_render(
+        ('Grid Map', historical_version, selected_year, selected_month, field, freq, step),
+        lambda: charts.grid_heatmap_chart(grids[step] * scale, slices.lats, slices.lons, vmin * scale, vmax * scale,
+                                          cmap, selected_field, f"{selected_field} - {selected_label}"))
+    col_left, col_center, col_right = st.columns([1,3,1])
+    with col_center:
+        show_chart(png)
+elif section == "Support Messages":
+    st.markdown("<h1 style='color:#22223b;'>Support Messages</h1>", unsafe_allow_html=True)
+
+    if not os.path.exists(SUPPORT_SQL_PATH):
+        st.warning('Support message dump not found.')
+    else:
+        support_db = get_support_db()
+        threads = load_support_conversations(support_db)
+        if threads.empty:
+            st.info('No conversations found.')
+        else:
+            def format_thread(i):
+                thread = threads.iloc[i]
+                if thread['chat_type'] == 'GROUP':
+                    name = f"Group {int(thread['group_id'])}"
+                else:
+                    name = f"Private {int(thread['user_a'])} ↔ {int(thread['user_b'])}"
+                return f"{name} ({thread['messages']} messages, last {thread['last_message']})"
+
+            selected_thread = st.selectbox('Select Conversation', range(len(threads)), format_func=format_thread)
+            thread = threads.iloc[selected_thread]
+
+            # Ngăn xếp con trỏ các trang đã xem của hội thoại này; trang đầu có con trỏ None
+            if thread['chat_type'] == 'GROUP':
+                thread_key = ('GROUP', int(thread['group_id']))
+            else:
+                thread_key = ('PRIVATE', int(thread['user_a']), int(thread['user_b']))
+            cursors = st.session_state.setdefault('support_cursors', {}).setdefault(thread_key, [None])
+            if thread['chat_type'] == 'GROUP':
+                page = support_store.group_thread(int(thread['group_id']), before=cursors[-1], db_path=support_db)
+            else:
+                page = support_store.private_thread(int(thread['user_a']), int(thread['user_b']),
+                                                    before=cursors[-1], db_path=support_db)
+
+            st.caption(f"Page {len(cursors)}, newest first")
+            st.dataframe(page[['created_at', 'sender_id', 'receiver_id', 'message']], hide_index=True)
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button('Newer', disabled=len(cursors) == 1):
+                    cursors.pop()
+                    st.rerun()
+            with col2:
+                if st.button('Older', disabled=len(page) < support_store.PAGE_SIZE):
+                    cursors.append(support_store.next_cursor(page))
+                    st.rerun()
+elif section == "Weather Forecast":
     st.markdown("<h1 style='color:#22223b;'>Weather Forecast</h1>", unsafe_allow_html=True)
-    df = forecast_df  # Use forecast data for this section
+    # Chọn lượt dự báo (mới nhất trước) và lượt để so sánh
+    forecast_runs = get_forecast_store(region).runs()
+    if not forecast_runs:
+        st.warning('No forecast data available.')
+        st.stop()
+    format_run = lambda r: f"{run_issue_time(r).strftime('%Y/%m/%d %H:%M')} ({r.split('-', 1)[1][:8]})"
+    col1, col2 = st.columns(2)
+    with col1:
+        selected_run = st.selectbox('Forecast Run', forecast_runs, format_func=format_run)
+    with col2:
+        compare_run = st.selectbox('Compare With Run', [None] + [r for r in forecast_runs if r != selected_run],
+                                   format_func=lambda r: 'None' if r is None else format_run(r))
+    index = get_forecast_index(region, selected_run)  # Use forecast data for this section
     
     # Chọn trường dữ liệu dự báo
     forecast_fields = {
@@ -350,159 +525,207 @@ else:
     }
     
     selected_forecast_field = st.selectbox('Select Attribute for Trend', list(forecast_fields.keys()))
-    dates = sorted(df['date'].unique())
+    dates = index.dates
     selected_date = st.selectbox('Select Date', dates, format_func=lambda x: x.strftime('%Y/%m/%d'))
     
+    # Tọa độ thật của trang trại: cảnh báo được nội suy, biểu đồ lấy ô lưới gần nhất
+    exact_location = st.checkbox('Enter exact farm coordinates')
     col1, col2 = st.columns(2)
     with col1:
-        lat = st.slider('Select Latitude', min_value=float(df['latitude'].min()), max_value=float(df['latitude'].max()), value=float(df['latitude'].min()), step=0.25, format="%.2f")
+        if exact_location:
+            lat = st.number_input('Latitude', value=float(index.lats[0]), step=0.01, format="%.4f")
+        else:
+            lat = st.slider('Select Latitude', min_value=float(index.lats[0]), max_value=float(index.lats[-1]), value=float(index.lats[0]), step=0.25, format="%.2f")
     with col2:
-        lon = st.slider('Select Longitude', min_value=float(df['longitude'].min()), max_value=float(df['longitude'].max()), value=float(df['longitude'].min()), step=0.25, format="%.2f")
+        if exact_location:
+            lon = st.number_input('Longitude', value=float(index.lons[0]), step=0.01, format="%.4f")
+        else:
+            lon = st.slider('Select Longitude', min_value=float(index.lons[0]), max_value=float(index.lons[-1]), value=float(index.lons[0]), step=0.25, format="%.2f")
     
-    df_point = df[(df['latitude'] == lat) & (df['longitude'] == lon) & (df['date'] == selected_date)]
+    grid_point = index.locator.snap(lat, lon)
+    if grid_point is None:
+        st.warning('This location is outside the forecast grid.')
+        grid_lat, grid_lon = lat, lon
+    else:
+        grid_lat, grid_lon = grid_point
+        if exact_location:
+            st.caption(f"Nearest grid point: {grid_lat:.2f}, {grid_lon:.2f}")
+    df_point = index.point_date(grid_lat, grid_lon, selected_date)
     
     # Thêm phần cảnh báo thời tiết cho nuôi trồng thủy sản
     st.markdown("### 🐟 Cảnh báo thời tiết cho nuôi trồng thủy sản")
     
-    # Lấy dữ liệu cho ngày được chọn
-    temp_data = df_point[df_point['t2m'].notna()]
-    precip_data = df_point[df_point['tp'].notna()]
-    wind_data = df_point[(df_point['u10'].notna()) & (df_point['v10'].notna())]
+    # Lấy chỉ số và mức cảnh báo của ngày được chọn từ bảng cảnh báo toàn lưới
+    point_alerts = query(
+        lambda client: client.forecast_alerts(selected_run, lat, lon, selected_date, interpolate=exact_location),
+        lambda: get_forecast_alerts(region, selected_run).point(lat, lon, selected_date, interpolate=exact_location))
     
-    if not temp_data.empty:
-        min_temp = temp_data['t2m'].min()
-        max_temp = temp_data['t2m'].max()
-        
+    def show_alert(metric):
+        value, rule = point_alerts[metric]
+        if rule is not None:
+            (st.error if rule.level == alerts.DANGER else st.warning)(rule.message)
+            st.markdown(rule.recommendations)
+        elif metric in alerts.SAFE_MESSAGES:
+            st.success(alerts.SAFE_MESSAGES[metric])
+    
+    # Giá trị dự báo so với chuẩn khí hậu cùng ngày, giờ và ô lưới (chỉ là tra mảng)
+    climatology_store, climatology = get_climatology(region)
+    df_normal = climatology.join(df_point) if climatology is not None and not df_point.empty else None
+    
+    min_temp, max_temp = point_alerts['min_temp'][0], point_alerts['max_temp'][0]
+    if not np.isnan(min_temp):
         # Hiển thị thông tin nhiệt độ
-        st.metric("Nhiệt độ dự báo", f"{min_temp:.1f}°C - {max_temp:.1f}°C")
-        
-        # Cảnh báo dựa trên ngưỡng nhiệt độ
-        if min_temp < 16:
-            st.error("⚠️ Cảnh báo: Nhiệt độ có thể xuống dưới 16°C - nguy hiểm cho thủy sản!")
-            st.markdown("""
-            **Khuyến nghị:**
-            - Tăng độ sâu ao nuôi lên ít nhất 2m
-            - Che phủ ao bằng bạt hoặc lưới
-            - Giảm 50% lượng thức ăn
-            - Theo dõi sức khỏe thủy sản mỗi 4 giờ
-            - Chuẩn bị hệ thống sưởi dự phòng
-            """)
-        elif min_temp < 20:
-            st.warning("⚠️ Lưu ý: Nhiệt độ có thể xuống dưới 20°C - cần theo dõi chặt chẽ")
-            st.markdown("""
-            **Khuyến nghị:**
-            - Theo dõi nhiệt độ nước mỗi 6 giờ
-            - Chuẩn bị phương án che phủ ao
-            - Giảm 30% lượng thức ăn
-            - Tăng cường sục khí
-            """)
-        else:
-            st.success("✅ Nhiệt độ trong khoảng an toàn cho thủy sản")
+        temp_anomaly = None
+        if df_normal is not None and 't2m_anomaly' in df_normal.columns and df_normal['t2m_anomaly'].notna().any():
+            temp_anomaly = f"{df_normal['t2m_anomaly'].mean():+.1f}°C so với trung bình nhiều năm"
+        st.metric("Nhiệt độ dự báo", f"{min_temp:.1f}°C - {max_temp:.1f}°C", delta=temp_anomaly, delta_color="off")
+        show_alert('min_temp')
     
     # Cảnh báo lượng mưa
-    if not precip_data.empty:
-        total_precip = precip_data['tp'].sum() * 1000  # Chuyển từ m sang mm
+    total_precip = point_alerts['total_precip'][0]
+    if not np.isnan(total_precip):
         st.metric("Lượng mưa dự báo", f"{total_precip:.1f} mm")
-        
-        if total_precip > 100:
-            st.error("⚠️ Cảnh báo: Lượng mưa rất lớn (>100mm) - nguy hiểm cho ao nuôi")
-            st.markdown("""
-            **Khuyến nghị:**
-            - Kiểm tra và nâng cấp hệ thống thoát nước
-            - Đo pH nước mỗi 4 giờ (duy trì 6.5-8.5)
-            - Ngừng cho ăn trong ngày mưa
-            - Tăng cường sục khí
-            - Theo dõi nồng độ oxy mỗi 2 giờ
-            - Chuẩn bị vôi để điều chỉnh pH
-            """)
-        elif total_precip > 50:
-            st.warning("⚠️ Cảnh báo: Lượng mưa lớn có thể ảnh hưởng đến ao nuôi")
-            st.markdown("""
-            **Khuyến nghị:**
-            - Kiểm tra hệ thống thoát nước
-            - Đo pH nước mỗi 6 giờ
-            - Giảm 50% lượng thức ăn
-            - Tăng cường sục khí
-            - Theo dõi nồng độ oxy mỗi 4 giờ
-            """)
+        show_alert('total_precip')
     
     # Cảnh báo gió
-    if not wind_data.empty:
-        wind_speeds = np.sqrt(wind_data['u10']**2 + wind_data['v10']**2)
-        max_wind = wind_speeds.max()
+    max_wind = point_alerts['max_wind'][0]
+    if not np.isnan(max_wind):
         st.metric("Tốc độ gió tối đa dự báo", f"{max_wind:.1f} m/s")
-        
-        if max_wind > 15:
-            st.error("⚠️ Cảnh báo: Gió rất mạnh (>15 m/s) - nguy hiểm cho ao nuôi")
-            st.markdown("""
-            **Khuyến nghị:**
-            - Cố định tất cả thiết bị trên ao
-            - Che chắn ao bằng lưới chắn gió
-            - Ngừng cho ăn trong thời gian gió mạnh
-            - Tăng cường theo dõi chất lượng nước mỗi 4 giờ
-            - Chuẩn bị máy phát điện dự phòng
-            """)
-        elif max_wind > 10:
-            st.warning("⚠️ Cảnh báo: Gió mạnh có thể ảnh hưởng đến ao nuôi")
-            st.markdown("""
-            **Khuyến nghị:**
-            - Cố định các thiết bị trên ao
-            - Che chắn ao để tránh bụi và vật lạ
-            - Giảm 50% lượng thức ăn
-            - Tăng cường theo dõi chất lượng nước mỗi 6 giờ
-            """)
+        show_alert('max_wind')
     
     # Cảnh báo áp suất khí quyển
-    if 'msl' in df_point.columns and df_point['msl'].notna().any():
-        pressure_data = df_point[df_point['msl'].notna()]
-        min_pressure = pressure_data['msl'].min() / 100  # Chuyển từ Pa sang hPa
-        max_pressure = pressure_data['msl'].max() / 100
-        
+    min_pressure, max_pressure = point_alerts['min_pressure'][0], point_alerts['max_pressure'][0]
+    if not np.isnan(min_pressure):
         st.metric("Áp suất khí quyển dự báo", f"{min_pressure:.1f} - {max_pressure:.1f} hPa")
-        
-        if min_pressure < 990:
-            st.error("⚠️ Cảnh báo: Áp suất khí quyển rất thấp (<990 hPa) - nguy hiểm cho thủy sản")
-            st.markdown("""
-            **Khuyến nghị:**
-            - Tăng cường sục khí 24/24
-            - Theo dõi nồng độ oxy mỗi 2 giờ
-            - Giảm 70% mật độ nuôi tạm thời
-            - Ngừng cho ăn
-            - Chuẩn bị máy phát điện dự phòng
-            """)
-        elif min_pressure < 1000:
-            st.warning("⚠️ Lưu ý: Áp suất khí quyển thấp có thể ảnh hưởng đến sức khỏe thủy sản")
-            st.markdown("""
-            **Khuyến nghị:**
-            - Tăng cường sục khí
-            - Theo dõi nồng độ oxy mỗi 4 giờ
-            - Giảm 50% mật độ nuôi tạm thời
-            - Giảm 50% lượng thức ăn
-            """)
+        show_alert('min_pressure')
+    
+    # Cảnh báo bất thường so với chuẩn khí hậu
+    if df_normal is not None:
+        for anomaly_field, zscore in alerts.anomaly_alerts(df_normal).items():
+            st.warning(f"{alerts.ANOMALY_MESSAGES[anomaly_field]} (z = {zscore:+.1f})")
     
     st.markdown(f"**{selected_forecast_field} Trend (Hourly)**")
     
-    if not df_point.empty:
+    def forecast_hourly(df_point, field):
         if 'level' in df_point.columns:
             min_level = df_point['level'].min()
             df_point = df_point[df_point['level'] == min_level]
+        return df_point.groupby('hour')[field].mean().reset_index()
+    
+    if not df_point.empty:
+        field = forecast_fields[selected_forecast_field]
+        df_hour = forecast_hourly(df_point, field)
+        y_data = df_hour[field]
         
-        df_hour = df_point.groupby('hour')[forecast_fields[selected_forecast_field]].mean().reset_index()
-        y_data = df_hour[forecast_fields[selected_forecast_field]]
+        # Đường so sánh với lượt dự báo khác cho cùng điểm và ngày
+        compare = None
+        if compare_run is not None:
+            compare_point = get_forecast_index(region, compare_run).point_date(grid_lat, grid_lon, selected_date)
+            if not compare_point.empty:
+                compare_hour = forecast_hourly(compare_point, field)
+                compare = (f"Run {format_run(compare_run)}", compare_hour['hour'], compare_hour[field])
         
-        fig2, ax2 = plt.subplots(figsize=(8, 4))
-        ax2.plot(df_hour['hour'], y_data, marker='o', color='b', linewidth=2, markersize=5)
-        ax2.set_xlabel('Hour', fontsize=10)
-        ax2.set_ylabel(selected_forecast_field, fontsize=10)
-        ax2.set_title(f"{selected_forecast_field} Trend on {selected_date}", fontsize=12)
-        ax2.tick_params(axis='both', labelsize=9)
-        ax2.grid(True)
-        plt.xticks(df_hour['hour'])
+        # Dải chuẩn khí hậu (p10-p90) và trung bình nhiều năm của cùng ngày
+        normal = None
+        if df_normal is not None and f'{field}_normal' in df_normal.columns:
+            normal_hour = df_normal.groupby('hour')[[f'{field}_normal', f'{field}_p10', f'{field}_p90']].mean()
+            normal = (normal_hour.index, normal_hour[f'{field}_normal'], normal_hour[f'{field}_p10'],
+                      normal_hour[f'{field}_p90'])
+        
+        png = chart_cache.get_or_render(
+            ('Weather Forecast', selected_run, compare_run, grid_lat, grid_lon, selected_date, field,
+             climatology_store if normal is not None else None),
+            lambda: charts.trend_chart(df_hour['hour'], y_data, selected_forecast_field,
+                                       f"{selected_forecast_field} Trend on {selected_date}",
+                                       label=f"Run {format_run(selected_run)}" if compare else None,
+                                       compare=compare, normal=normal))
         col_left, col_center, col_right = st.columns([1,3,1])
         with col_center:
-            st.pyplot(fig2, use_container_width=False)
+            show_chart(png)
+        
+        if normal is not None:
+            st.markdown("**So với trung bình nhiều năm**")
+            st.dataframe(pd.DataFrame({
+                'Hour': df_hour['hour'].to_numpy(),
+                'Forecast': y_data.to_numpy(),
+                'Normal': normal[1].reindex(df_hour['hour']).to_numpy(),
+                'Anomaly': y_data.to_numpy() - normal[1].reindex(df_hour['hour']).to_numpy(),
+            }), hide_index=True)
     else:
         st.warning('No forecast data for this location on selected date.')
+else:
+    st.markdown("<h1 style='color:#22223b;'>Region Comparison</h1>", unsafe_allow_html=True)
+    # Lượt dự báo mới nhất của mọi vùng, so sánh trên cùng một màn hình
+    run_ids = tuple(get_forecast_store(r).latest() for r in REGIONS)
+    summary = get_region_comparison(run_ids)
+    if summary.empty:
+        st.warning('No forecast data available.')
+    else:
+        region_names = {r.key: r.name for r in REGIONS}
+        region_keys = [key for key in region_names if key in set(summary['region'])]
+        dates = sorted(summary['date'].unique())
+        date_labels = [d.strftime('%d/%m') for d in dates]
+        comparison_metrics = {
+            'Minimum Temperature (°C)': ('min_temp', '{:.1f}'),
+            'Rainfall (mm)': ('total_precip', '{:.0f}'),
+            'Max Wind (m/s)': ('max_wind', '{:.1f}'),
+        }
+        existing_metrics = {k: v for k, v in comparison_metrics.items() if v[0] in summary.columns}
+        selected_metrics = st.multiselect('Select Attributes', list(existing_metrics.keys()),
+                                          default=list(existing_metrics.keys())[:2])
+        for selected_metric in selected_metrics:
+            name, fmt = existing_metrics[selected_metric]
+            values = summary.pivot(index='region', columns='date', values=name).reindex(index=region_keys, columns=dates)
+            levels = summary.pivot(index='region', columns='date', values=f'{name}_level').reindex(
+                index=region_keys, columns=dates).fillna(alerts.SAFE)
+            png = chart_cache.get_or_render(
+                ('Region Comparison', run_ids, name),
+                lambda: charts.region_alert_chart(values.to_numpy(np.float64), levels.to_numpy(),
+                                                  [region_names[k] for k in region_keys], date_labels, fmt,
+                                                  selected_metric))
+            show_chart(png)
+
+        # Các ngày có cảnh báo của từng vùng
+        alerted = summary[summary['level'] >= alerts.WARNING]
+        st.markdown("**Alerts by region**")
+        st.dataframe(pd.DataFrame({
+            'Region': alerted['region'].map(region_names).astype(str),
+            'Date': alerted['date'],
+            'Level': alerted['level'].map({alerts.WARNING: 'Warning', alerts.DANGER: 'Danger'}),
+            'Cells alerted': alerted['cells_alerted'],
+        }), hide_index=True)
+
+# Kết thúc phần Weather Forecast và Region Comparison
+
+# Thời gian rerun theo section và bảng debug hiệu năng
+rerun_seconds = time.perf_counter() - rerun_start
+metrics.REGISTRY.observe('rerun', rerun_seconds, section=section)
+rerun_spans = metrics.REGISTRY.end_trace()
+metrics.REGISTRY.set_gauge('chart_cache_entries', len(chart_cache))
+metrics.REGISTRY.set_gauge('chart_cache_hits', chart_cache.hits)
+metrics.REGISTRY.set_gauge('chart_cache_misses', chart_cache.misses)
+if metrics.peak_rss_bytes() is not None:
+    metrics.REGISTRY.set_gauge('peak_rss_bytes', metrics.peak_rss_bytes())
+if METRICS_TEXTFILE:
+    metrics.REGISTRY.write_textfile(METRICS_TEXTFILE)
 
-# Kết thúc phần Weather Forecast, không có code nào phía dưới nữa
+if show_debug:
+    with st.sidebar:
+        st.markdown("### Performance")
+        st.caption(f"This rerun: {rerun_seconds * 1000:.1f} ms")
+        st.dataframe(pd.DataFrame(
+            [(name, ', '.join(f"{k}={v}" for k, v in labels.items()), seconds * 1000)
+             for name, labels, seconds in rerun_spans],
+            columns=['Span', 'Labels', 'ms']), hide_index=True)
+        summary = metrics.REGISTRY.summary()
+        st.markdown("**Rerun latency by section**")
+        st.dataframe(pd.DataFrame(
+            [(dict(key).get('section'), stats['count'], stats['p50'] * 1000, stats['p95'] * 1000)
+             for (name, key), stats in summary.items() if name == 'rerun'],
+            columns=['Section', 'Reruns', 'p50 ms', 'p95 ms']), hide_index=True)
+        st.markdown("**Memory**")
+        st.dataframe(pd.DataFrame(
+            [(name, ', '.join(f"{k}={v}" for k, v in key), value / (1024 * 1024))
+             for (name, key), value in metrics.REGISTRY.gauges().items() if name.endswith('bytes')],
+            columns=['Gauge', 'Labels', 'MB']), hide_index=True)
 
@@ -0,0 +1,38 @@
+"""Ghi file theo kiểu ghi bản tạm rồi đổi tên, an toàn khi nhiều tiến trình/thread cùng ghi một đích."""
+import os
+import json
+import uuid
+import shutil
+
+
+def tmp_name(path):
+    # Tên tạm riêng cho mỗi lần ghi (pid + ngẫu nhiên): nhiều tiến trình Streamlit, hoặc nhiều thread
+    # trong một tiến trình, có thể cùng ghi một đích
+    return f"{path}.{os.getpid()}-{uuid.uuid4().hex[:8]}.tmp"
+
+
+def publish(tmp_path, path):
+    """Đổi tên bản tạm thành path. Nếu tiến trình khác đã đưa bản của nó vào trước thì giữ bản đó
+    (các tiến trình khác có thể đang memory-map nó) và bỏ bản của mình."""
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        if not os.path.exists(path):
+            raise
+        if os.path.isdir(tmp_path):
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        else:
+            os.remove(tmp_path)
+
+
+def write_text(path, text):
+    """Ghi nguyên tử: người đọc chỉ thấy bản cũ hoặc bản mới đầy đủ, không thấy file ghi dở."""
+    tmp_path = tmp_name(path)
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    publish(tmp_path, path)
+
+
+def write_json(path, obj):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    write_text(path, json.dumps(obj, indent=2))
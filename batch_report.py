@@ -0,0 +1,148 @@
+"""Xuất báo cáo Yearly/Monthly Analysis cho mọi ô lưới, không cần Streamlit.
+
+Ví dụ:
+    python batch_report.py "output_from_grib.csv" --out reports --workers 8
+
+Mỗi ô lưới được ghi vào một thư mục riêng; ô đã xong có file đánh dấu (ghi lại hash file nguồn,
+--years và --no-monthly) nên chạy lại cùng lệnh sẽ tiếp tục từ chỗ bị dừng, còn đổi tham số
+hoặc dữ liệu nguồn thì các ô được ghi lại.
+"""
+import os
+import json
+import argparse
+import html
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import data_store
+import rollups
+import charts
+
+DONE_MARKER = '.done'
+
+# Dữ liệu dùng chung trong mỗi tiến trình con (rollup được memory-map nên không tốn thêm RAM)
+_worker = {}
+
+
+def _init_worker(csv_path, store_dir):
+    _worker['manifest'] = data_store.historical_manifest(csv_path, store_dir)
+    _worker['monthly'], _worker['daily'] = data_store.load_rollups(csv_path, store_dir)
+
+
+def cell_dir(out_dir, lat, lon):
+    return os.path.join(out_dir, f"lat_{lat:.2f}_lon_{lon:.2f}")
+
+
+def run_params(source, years=None, monthly=True):
+    """Nội dung file đánh dấu: ô chỉ được coi là xong nếu ghi từ cùng dữ liệu với cùng tham số."""
+    return {'source': source, 'years': sorted(years) if years else None, 'monthly': bool(monthly)}
+
+
+def _read_marker(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):  # chưa có, hoặc file đánh dấu rỗng của phiên bản trước
+        return None
+
+
+def _write_png(path, fig):
+    with open(path, 'wb') as f:
+        f.write(charts.figure_to_png(fig))
+
+
+def _section_html(title, stats, images):
+    parts = [f"<h2>{html.escape(title)}</h2>"]
+    parts += [f'<img src="{name}" style="max-width:48%">' for name in images]
+    parts.append(stats.to_html(index=False, float_format='%.2f'))
+    return '\n'.join(parts)
+
+
+def write_cell_report(lat, lon, out_dir, years=None, monthly=True, source=None):
+    """Ghi PNG/CSV/HTML của một ô lưới; trả về số báo cáo đã ghi. source là hash file nguồn."""
+    manifest, monthly_cube, daily_cube = _worker['manifest'], _worker['monthly'], _worker['daily']
+    target = cell_dir(out_dir, lat, lon)
+    os.makedirs(target, exist_ok=True)
+    sections = []
+    for year in years or manifest['years']:
+        month_stats = rollups.monthly_stats(monthly_cube, lat, lon, year)
+        if month_stats.empty:
+            continue
+        name = f"yearly_{year}"
+        month_stats.to_csv(os.path.join(target, f"{name}.csv"), index=False)
+        images = [f"{name}.png"]
+        _write_png(os.path.join(target, images[0]), charts.rainfall_temperature_chart(
+            month_stats, 'month_label', 'Month', 'Temperature and Rainfall Analysis by Month'))
+        pie_data = month_stats[month_stats['total_precip'] > 0]
+        if not pie_data.empty:
+            images.append(f"{name}_pie.png")
+            _write_png(os.path.join(target, images[1]), charts.rainfall_pie_chart(
+                pie_data['total_precip'], pie_data['month_label'], "Month", 'Rainfall Distribution by Month'))
+        sections.append(_section_html(f"Year {year}", month_stats, images))
+
+        if not monthly:
+            continue
+        for month in manifest['months'].get(str(year), []):
+            daily_stats = rollups.daily_stats(daily_cube, lat, lon, year, month)
+            if daily_stats.empty:
+                continue
+            name = f"monthly_{year}_{month:02d}"
+            daily_stats.to_csv(os.path.join(target, f"{name}.csv"), index=False)
+            images = [f"{name}.png"]
+            _write_png(os.path.join(target, images[0]), charts.rainfall_temperature_chart(
+                daily_stats, 'date', 'Date', 'Temperature and Rainfall Analysis', rotate_labels=True))
+            pie_data = daily_stats[daily_stats['total_precip'] > 0]
+            if not pie_data.empty:
+                images.append(f"{name}_pie.png")
+                _write_png(os.path.join(target, images[1]), charts.rainfall_pie_chart(
+                    pie_data['total_precip'], pie_data['date'].astype(str), "Date", 'Rainfall Distribution by Day'))
+            sections.append(_section_html(f"{month:02d}/{year}", daily_stats, images))
+
+    with open(os.path.join(target, 'index.html'), 'w', encoding='utf-8') as f:
+        f.write(f"<html><head><meta charset='utf-8'><title>{lat:.2f}, {lon:.2f}</title></head><body>\n"
+                f"<h1>Weather report ({lat:.2f}, {lon:.2f})</h1>\n" + '\n'.join(sections) + "\n</body></html>\n")
+    # Đánh dấu hoàn thành sau cùng để lần chạy sau (cùng tham số) bỏ qua ô này
+    with open(os.path.join(target, DONE_MARKER), 'w', encoding='utf-8') as f:
+        json.dump(run_params(source, years, monthly), f)
+    return len(sections)
+
+
+def pending_cells(manifest, out_dir, params):
+    # Hàng đợi công việc: các ô chưa có file đánh dấu, hoặc đánh dấu của lần chạy khác tham số/dữ liệu
+    return [
+        (lat, lon)
+        for lat in manifest['latitudes']
+        for lon in manifest['longitudes']
+        if _read_marker(os.path.join(cell_dir(out_dir, lat, lon), DONE_MARKER)) != params
+    ]
+
+
+def run(csv_path, out_dir, store_dir=data_store.STORE_DIR, years=None, monthly=True, workers=None):
+    # Dựng store (nếu chưa có) một lần trước khi chia việc cho các tiến trình
+    manifest = data_store.historical_manifest(csv_path, store_dir)
+    source = data_store.source_hash(csv_path, store_dir)
+    cells = pending_cells(manifest, out_dir, run_params(source, years, monthly))
+    total = len(manifest['latitudes']) * len(manifest['longitudes'])
+    print(f"{total - len(cells)}/{total} cells already done, {len(cells)} pending")
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(csv_path, store_dir)) as pool:
+        futures = {pool.submit(write_cell_report, lat, lon, out_dir, years, monthly, source): (lat, lon)
+                   for lat, lon in cells}
+        for done, future in enumerate(as_completed(futures), 1):
+            lat, lon = futures[future]
+            print(f"[{done}/{len(cells)}] ({lat:.2f}, {lon:.2f}): {future.result()} reports", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate per-cell Yearly/Monthly weather reports.')
+    parser.add_argument('csv_path', help='historical ERA5 CSV exported from GRIB')
+    parser.add_argument('--out', default='reports', help='output directory')
+    parser.add_argument('--store-dir', default=data_store.STORE_DIR)
+    parser.add_argument('--years', type=int, nargs='*', help='only these years (default: all)')
+    parser.add_argument('--no-monthly', action='store_true', help='skip the per-month reports')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: CPU count)')
+    args = parser.parse_args()
+    run(args.csv_path, args.out, args.store_dir, args.years, not args.no_monthly, args.workers)
+
+
+if __name__ == '__main__':
+    main()
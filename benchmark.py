@@ -0,0 +1,230 @@
+"""Đo thời gian nạp dữ liệu và truy vấn trên lưới ERA5 tổng hợp (synthetic).
+
+Ví dụ:
+    python benchmark.py --years 2 --resolution 0.25 --output bench.json
+
+Kết quả là JSON (thời gian, throughput, peak RSS từng bước, bộ nhớ từng cột của frame đã nạp) để so sánh giữa các phiên bản.
+"""
+import os
+import sys
+import json
+import shutil
+import time
+import argparse
+import platform
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import data_store
+import metrics
+import rollups
+import alerts
+from grid_index import GridIndex
+from rollups import RollupCube
+
+# Vùng mặc định quanh Hà Nội
+DEFAULT_EXTENT = (20.0, 22.0, 105.0, 107.0)
+
+
+def synthetic_grid(years, resolution, extent=DEFAULT_EXTENT, start_year=2000, freq='6h', seed=0):
+    """Lưới 6 giờ/lần với các trường giống file xuất từ GRIB (t2m theo K, msl theo Pa, tp theo m)."""
+    lat_min, lat_max, lon_min, lon_max = extent
+    lats = np.arange(lat_min, lat_max + resolution / 2, resolution)
+    lons = np.arange(lon_min, lon_max + resolution / 2, resolution)
+    times = pd.date_range(f'{start_year}-01-01', f'{start_year + years - 1}-12-31 18:00', freq=freq)
+    t, la, lo = np.meshgrid(np.arange(len(times)), lats, lons, indexing='ij')
+    n = t.size
+    rng = np.random.default_rng(seed)
+    day_of_year = times.dayofyear.to_numpy()[t.ravel()]
+    season = np.cos(2 * np.pi * (day_of_year - 200) / 365.25)
+    return pd.DataFrame({
+        'time': times[t.ravel()],
+        'latitude': la.ravel(),
+        'longitude': lo.ravel(),
+        't2m': 297 + 6 * season + 2 * rng.standard_normal(n),
+        'msl': 101000 - 500 * season + 300 * rng.standard_normal(n),
+        'tp': np.clip(rng.gamma(0.3, 0.002, n), 0, None),
+        'u10': 3 * rng.standard_normal(n),
+        'v10': 3 * rng.standard_normal(n),
+    })
+
+
+def synthetic_forecast(days, resolution, extent=DEFAULT_EXTENT, seed=1):
+    df = synthetic_grid(1, resolution, extent, start_year=2025, seed=seed)
+    df = df[df['time'] < df['time'].min() + pd.Timedelta(days=days)]
+    # Đổi sang tên cột của file dự báo
+    return df.rename(columns={v: k for k, v in data_store.FORECAST_COLUMNS.items()})
+
+
+def legacy_schema(df):
+    """Frame với lược đồ của các loader cũ (float64, int64, date là datetime.date, tên là chuỗi)
+    để so sánh bộ nhớ với lược đồ gọn."""
+    legacy = df.copy()
+    for col in data_store.MEASUREMENT_COLUMNS:
+        if col in legacy.columns:
+            legacy[col] = legacy[col].astype(np.float64)
+    for col in data_store.CALENDAR_DTYPES:
+        legacy[col] = legacy[col].astype(np.int64)
+    legacy['date'] = legacy['time'].dt.date
+    for col in ('day_name', 'month_name'):
+        legacy[col] = legacy[col].astype(object)
+    return legacy
+
+
+def memory_report(df):
+    compact = metrics.frame_memory_report(df)
+    legacy = metrics.frame_memory_report(legacy_schema(df))
+    report = {
+        'rows': len(df),
+        'bytes': int(compact['bytes'].sum()),
+        'legacy_bytes': int(legacy['bytes'].sum()),
+        'columns': {row.column: {'dtype': row.dtype, 'bytes': int(row.bytes)} for row in compact.itertuples()},
+    }
+    report['ratio'] = report['bytes'] / report['legacy_bytes'] if report['legacy_bytes'] else None
+    print(f"{'memory':<32} {report['bytes'] / 2**20:8.1f} MB  (legacy schema {report['legacy_bytes'] / 2**20:.1f} MB)",
+          file=sys.stderr)
+    return report
+
+
+def peak_rss_mb():
+    peak = metrics.peak_rss_bytes()
+    return None if peak is None else round(peak / (1024 * 1024), 1)
+
+
+class Bench:
+    def __init__(self):
+        self.results = []
+
+    def run(self, name, fn, rows=None, repeat=1):
+        # Không đặt lại được (vd. macOS/Windows) thì peak_rss_mb là đỉnh tính từ đầu tiến trình
+        step_peak = metrics.reset_peak_rss()
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            value = fn()
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+        result = {
+            'name': name,
+            'seconds': best,
+            'mean_seconds': sum(timings) / len(timings),
+            'repeat': repeat,
+            'peak_rss_mb': peak_rss_mb(),
+            'peak_rss_scope': 'step' if step_peak else 'process',
+        }
+        if rows:
+            result['rows'] = rows
+            result['rows_per_second'] = rows / best if best > 0 else None
+        self.results.append(result)
+        print(f"{name:<32} {best * 1000:10.2f} ms  peak RSS {result['peak_rss_mb']} MB", file=sys.stderr)
+        return value
+
+
+def run_benchmarks(years, resolution, forecast_days=10, queries=200, work_dir=None):
+    bench = Bench()
+    cleanup = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix='weather-bench-')
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        return _run(bench, years, resolution, forecast_days, queries, work_dir)
+    finally:
+        if cleanup:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _run(bench, years, resolution, forecast_days, queries, work_dir):
+    store_dir = os.path.join(work_dir, 'store')
+    hist_csv = os.path.join(work_dir, 'historical.csv')
+    fc_csv = os.path.join(work_dir, 'forecast.csv')
+
+    historical = synthetic_grid(years, resolution)
+    historical.to_csv(hist_csv, index=False)
+    synthetic_forecast(forecast_days, resolution).to_csv(fc_csv, index=False)
+    rows = len(historical)
+    del historical
+
+    bench.run('cold_load_historical', lambda: data_store.build_historical_store(hist_csv, store_dir), rows)
+    df = bench.run('warm_load_historical', lambda: data_store.load_historical(hist_csv, store_dir), rows, repeat=3)
+    manifest = data_store.historical_manifest(hist_csv, store_dir)
+    year, month = manifest['years'][-1], manifest['months'][str(manifest['years'][-1])][0]
+    bench.run('warm_load_partition', lambda: data_store.load_historical(
+        hist_csv, store_dir, years=[year], months=[month]), repeat=3)
+
+    rng = np.random.default_rng(0)
+    points = list(zip(rng.choice(manifest['latitudes'], queries), rng.choice(manifest['longitudes'], queries)))
+    day = pd.Timestamp(manifest['dates'][len(manifest['dates']) // 2])
+
+    def mask_lookup():
+        for lat, lon in points:
+            df[(df['latitude'] == lat) & (df['longitude'] == lon) & (df['date'] == day)]
+
+    index = bench.run('build_grid_index', lambda: GridIndex(df), rows)
+
+    def index_lookup():
+        for lat, lon in points:
+            index.point_date(lat, lon, day)
+
+    bench.run('point_lookup_mask', mask_lookup, queries)
+    bench.run('point_lookup_index', index_lookup, queries, repeat=3)
+
+    def groupby_monthly():
+        for lat, lon in points[:20]:
+            point_df = df[(df['year'] == year) & (df['latitude'] == lat) & (df['longitude'] == lon)]
+            point_df.groupby('month').agg({'t2m': ['max', 'min'], 'tp': 'sum'})
+
+    bench.run('monthly_stats_groupby', groupby_monthly, 20)
+    bench.run('build_rollups_monthly', lambda: RollupCube.from_frame(df, 'M'), rows)
+    bench.run('build_rollups_daily', lambda: RollupCube.from_frame(df, 'D'), rows)
+    monthly_cube, daily_cube = data_store.load_rollups(hist_csv, store_dir)
+    bench.run('monthly_stats_rollup', lambda: [
+        rollups.monthly_stats(monthly_cube, lat, lon, year) for lat, lon in points], queries, repeat=3)
+    bench.run('daily_stats_rollup', lambda: [
+        rollups.daily_stats(daily_cube, lat, lon, year, month) for lat, lon in points], queries, repeat=3)
+
+    forecast = bench.run('load_forecast', lambda: data_store.load_forecast(fc_csv, store_dir))
+    bench.run('evaluate_alerts', lambda: alerts.evaluate_alerts(forecast), len(forecast), repeat=3)
+    memory = {'historical': memory_report(df), 'forecast': memory_report(forecast)}
+
+    return {
+        'config': {
+            'years': years,
+            'resolution': resolution,
+            'forecast_days': forecast_days,
+            'rows': rows,
+            'cells': len(manifest['latitudes']) * len(manifest['longitudes']),
+            'queries': queries,
+        },
+        'environment': {
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+        },
+        'results': bench.results,
+        'memory': memory,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark load and query paths on synthetic ERA5-shaped data.')
+    parser.add_argument('--years', type=int, default=2)
+    parser.add_argument('--resolution', type=float, default=0.25, help='grid step in degrees')
+    parser.add_argument('--forecast-days', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=200, help='point queries per lookup benchmark')
+    parser.add_argument('--work-dir', help='where to write the synthetic CSVs and store (default: temp dir)')
+    parser.add_argument('--output', help='write JSON results to this file (default: stdout)')
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.years, args.resolution, args.forecast_days, args.queries, args.work_dir)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+import io
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import matplotlib
+from matplotlib.colors import ListedColormap
+from matplotlib.figure import Figure
+
+import metrics
+
+# Giống mặc định của st.pyplot để ảnh hiển thị như trước
+CHART_DPI = 200
+CHART_CACHE_SIZE = 256
+# Bản đồ lưới: một ảnh cho mỗi (trường, thời điểm) nên cần nhiều chỗ hơn
+TILE_CACHE_SIZE = 1024
+
+
+@metrics.timed('chart_rasterize')
+def figure_to_png(fig):
+    """Raster hóa figure thành PNG rồi giải phóng nó ngay."""
+    buf = io.BytesIO()
+    try:
+        fig.savefig(buf, format='png', bbox_inches='tight', dpi=CHART_DPI)
+    finally:
+        # Figure tạo trực tiếp (không qua pyplot) nên không bị giữ trong registry toàn cục
+        fig.clear()
+    return buf.getvalue()
+
+
+class ChartCache:
+    """LRU cache giới hạn số ảnh biểu đồ (PNG) theo khóa (section, điểm, kỳ, trường)."""
+
+    def __init__(self, max_entries=CHART_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._images = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_render(self, key, build):
+        with self._lock:
+            if key in self._images:
+                self._images.move_to_end(key)
+                self.hits += 1
+                return self._images[key]
+        with metrics.span('chart_build'):
+            fig = build()
+        png = figure_to_png(fig)
+        with self._lock:
+            self.misses += 1
+            self._images[key] = png
+            self._images.move_to_end(key)
+            while len(self._images) > self.max_entries:
+                self._images.popitem(last=False)
+        return png
+
+    def __len__(self):
+        return len(self._images)
+
+
+def rainfall_temperature_chart(stats, x, xlabel, title, rotate_labels=False):
+    # Cột lượng mưa và đường max/min nhiệt độ trên hai trục y
+    fig = Figure(figsize=(7, 5))
+    ax1 = fig.subplots()
+    ax1.bar(stats[x], stats['total_precip'], color='dodgerblue', alpha=0.6, label='Total Precipitation')
+    ax1.set_ylabel('Rainfall (mm)', color='dodgerblue')
+    ax1.tick_params(axis='y', labelcolor='dodgerblue')
+    ax1.set_xlabel(xlabel)
+    ax2 = ax1.twinx()
+    ax2.plot(stats[x], stats['max_temp'], color='crimson', marker='o', label='Max Temperature')
+    ax2.plot(stats[x], stats['min_temp'], color='forestgreen', marker='o', label='Min Temperature')
+    ax2.set_ylabel('Temperature (°C)', color='crimson')
+    ax2.tick_params(axis='y', labelcolor='crimson')
+    if rotate_labels:
+        fig.autofmt_xdate(rotation=45)
+    else:
+        ax2.set_xticks(range(len(stats)), stats[x])
+    ax1.legend(loc='upper left')
+    ax2.legend(loc='upper right')
+    ax2.set_title(title)
+    return fig
+
+
+def rainfall_pie_chart(values, labels, legend_title, title):
+    # Pie chart: chỉ hiện % >7%, không label trực tiếp, legend bên cạnh
+    def autopct_func(pct):
+        return f'{pct:.1f}%' if pct > 7 else ''
+    fig = Figure(figsize=(7, 5))
+    ax = fig.subplots()
+    wedges, texts, autotexts = ax.pie(
+        values,
+        labels=None,
+        autopct=autopct_func,
+        startangle=90,
+        colors=matplotlib.colormaps['tab20'].colors,
+        textprops={'fontsize': 12, 'weight': 'bold'}
+    )
+    ax.legend(wedges, labels, title=legend_title, loc="center left", bbox_to_anchor=(1, 0.5), fontsize=11)
+    ax.set_title(title, fontsize=14, weight='bold')
+    return fig
+
+
+def trend_chart(hours, values, ylabel, title, label=None, compare=None, normal=None):
+    # Xu hướng theo giờ trong một ngày; compare=(nhãn, giờ, giá trị) để vẽ thêm một đường so sánh,
+    # normal=(giờ, trung bình, p10, p90) để vẽ chuẩn khí hậu cùng ngày
+    fig = Figure(figsize=(8, 4))
+    ax = fig.subplots()
+    if normal is not None:
+        normal_hours, normal_mean, normal_low, normal_high = normal
+        ax.fill_between(normal_hours, normal_low, normal_high, color='gray', alpha=0.2, linewidth=0, label='Normal p10-p90')
+        ax.plot(normal_hours, normal_mean, color='gray', linestyle=':', linewidth=2, label='Normal')
+        label = label or 'Forecast'
+    ax.plot(hours, values, marker='o', color='b', linewidth=2, markersize=5, label=label)
+    if compare is not None:
+        compare_label, compare_hours, compare_values = compare
+        ax.plot(compare_hours, compare_values, marker='s', color='darkorange', linestyle='--',
+                linewidth=2, markersize=5, label=compare_label)
+    if compare is not None or normal is not None:
+        ax.legend(fontsize=9)
+    ax.set_xlabel('Hour', fontsize=10)
+    ax.set_ylabel(ylabel, fontsize=10)
+    ax.set_title(title, fontsize=12)
+    ax.tick_params(axis='both', labelsize=9)
+    ax.grid(True)
+    ax.set_xticks(hours)
+    return fig
+
+
+def lod_trend_chart(series, ylabel, title):
+    # Đường trung bình và dải min-max cho chuỗi dài đã giảm mẫu
+    fig = Figure(figsize=(10, 4))
+    ax = fig.subplots()
+    ax.fill_between(series['time'], series['min'], series['max'], color='b', alpha=0.2, linewidth=0, label='Min-Max')
+    ax.plot(series['time'], series['mean'], color='b', linewidth=1.2, label='Mean')
+    ax.set_xlabel('Time', fontsize=10)
+    ax.set_ylabel(ylabel, fontsize=10)
+    ax.set_title(title, fontsize=12)
+    ax.tick_params(axis='both', labelsize=9)
+    ax.grid(True)
+    ax.legend(fontsize=9)
+    fig.autofmt_xdate()
+    return fig
+
+
+def grid_heatmap_chart(grid, lats, lons, vmin, vmax, cmap, label, title):
+    # Bản đồ màu của cả lưới tại một thời điểm/kỳ; thang màu cố định do người gọi truyền vào
+    fig = Figure(figsize=(7, 5))
+    ax = fig.subplots()
+    mesh = ax.pcolormesh(lons, lats, grid, shading='nearest', cmap=cmap, vmin=vmin, vmax=vmax)
+    fig.colorbar(mesh, ax=ax, label=label)
+    ax.set_xlabel('Longitude', fontsize=10)
+    ax.set_ylabel('Latitude', fontsize=10)
+    ax.set_title(title, fontsize=12)
+    ax.set_aspect('equal')
+    ax.tick_params(axis='both', labelsize=9)
+    return fig
+
+
+# Màu theo mức cảnh báo: an toàn, lưu ý, nguy hiểm
+LEVEL_COLORS = ['#d8f3dc', '#ffd166', '#ef476f']
+
+
+def region_alert_chart(values, levels, regions, dates, fmt, title):
+    # Bảng màu (vùng x ngày): màu là mức cảnh báo, chữ là giá trị chỉ số
+    fig = Figure(figsize=(max(6, 0.8 * len(dates) + 2), max(2, 0.5 * len(regions) + 1.2)))
+    ax = fig.subplots()
+    ax.imshow(levels, cmap=ListedColormap(LEVEL_COLORS), vmin=-0.5, vmax=len(LEVEL_COLORS) - 0.5, aspect='auto')
+    for i in range(len(regions)):
+        for j in range(len(dates)):
+            if not np.isnan(values[i, j]):
+                ax.text(j, i, fmt.format(values[i, j]), ha='center', va='center', fontsize=8)
+    ax.set_xticks(range(len(dates)))
+    ax.set_xticklabels(dates, rotation=45, ha='right', fontsize=9)
+    ax.set_yticks(range(len(regions)))
+    ax.set_yticklabels(regions, fontsize=9)
+    ax.set_title(title, fontsize=12)
+    return fig
@@ -0,0 +1,257 @@
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from grid_index import GridLocator, DERIVED_FIELDS
+
+CLIMATOLOGY_FIELDS = ['t2m', 'tp', 'wind', 'msl']
+CLIMATOLOGY_STATS = ['mean', 'std', 'p10', 'p50', 'p90']
+PERCENTILES = {'p10': 10, 'p50': 50, 'p90': 90}
+# Số ngày của cửa sổ quanh mỗi ngày trong năm, để có đủ mẫu khi chỉ có ít năm lịch sử
+WINDOW_DAYS = 15
+DAYS_IN_YEAR = 366
+# Ngày đầu mỗi tháng (0-based) theo năm nhuận: 29/2 là ngày 59, 1/3 luôn là ngày 60
+_MONTH_START = np.concatenate(([0], np.cumsum([31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])[:-1]))
+
+
+def day_of_year(times):
+    """Chỉ số ngày trong năm 0..365 theo lịch năm nhuận, để cùng ngày/tháng luôn cùng chỉ số."""
+    times = pd.DatetimeIndex(times)
+    return _MONTH_START[times.month.to_numpy() - 1] + times.day.to_numpy() - 1
+
+
+def _field_values(df, field):
+    if field in DERIVED_FIELDS:
+        inputs, derive = DERIVED_FIELDS[field]
+        if not all(c in df.columns for c in inputs):
+            return None
+        return derive(*(df[c].to_numpy(np.float32) for c in inputs))
+    return df[field].to_numpy(np.float32) if field in df.columns else None
+
+
+def nan_percentiles(samples, qs):
+    """Phân vị (nội suy tuyến tính như np.percentile) theo trục 0, bỏ qua NaN.
+
+    Nhanh hơn nhiều so với np.nanpercentile: chỉ một lần sort (NaN bị đẩy xuống cuối).
+    """
+    ordered = np.sort(samples, axis=0)
+    count = (~np.isnan(samples)).sum(axis=0)
+    result = []
+    for q in qs:
+        pos = q / 100 * np.maximum(count - 1, 0)
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.minimum(lo + 1, np.maximum(count - 1, 0))
+        low = np.take_along_axis(ordered, lo[None], axis=0)[0]
+        high = np.take_along_axis(ordered, hi[None], axis=0)[0]
+        result.append(np.where(count > 0, low + (high - low) * (pos - lo), np.nan))
+    return np.stack(result)
+
+
+class ClimatologyBuilder:
+    """Dựng Climatology trong khi ingest mà bộ nhớ không phụ thuộc kích thước file.
+
+    update() cộng dồn sum/sumsq/count theo (ngày trong năm, giờ, lat, lon) cho từng chunk; build() tính
+    mean/std từ các tổng đó và tính phân vị theo từng khối ô lưới, mỗi khối chỉ đọc dữ liệu của các ô
+    trong khối (khoảng block_rows dòng).
+    """
+
+    def __init__(self, fields=CLIMATOLOGY_FIELDS, window=WINDOW_DAYS):
+        self.fields = list(fields)
+        self.window = window
+        self.rows = 0
+        self.lats = np.array([], dtype=np.float64)
+        self.lons = np.array([], dtype=np.float64)
+        self.hours = np.array([], dtype=np.int64)
+        # {(field, 'sum'/'sq'/'n'): mảng (366, giờ, lat, lon)}; kích thước theo lưới, không theo số năm
+        self._totals = {}
+
+    def _grow(self, hours, lats, lons):
+        new_hours = np.union1d(self.hours, hours)
+        new_lats = np.union1d(self.lats, lats)
+        new_lons = np.union1d(self.lons, lons)
+        if len(new_hours) == len(self.hours) and len(new_lats) == len(self.lats) and len(new_lons) == len(self.lons):
+            return
+        shape = (DAYS_IN_YEAR, len(new_hours), len(new_lats), len(new_lons))
+        index = np.ix_(np.arange(DAYS_IN_YEAR), np.searchsorted(new_hours, self.hours),
+                       np.searchsorted(new_lats, self.lats), np.searchsorted(new_lons, self.lons))
+        for key, old in self._totals.items():
+            arr = np.zeros(shape, dtype=np.float64)
+            arr[index] = old
+            self._totals[key] = arr
+        self.hours, self.lats, self.lons = new_hours, new_lats, new_lons
+
+    def update(self, df):
+        if df.empty:
+            return self
+        times = pd.DatetimeIndex(df['time'])
+        hour = times.hour.to_numpy()
+        lat = df['latitude'].to_numpy()
+        lon = df['longitude'].to_numpy()
+        self._grow(np.unique(hour), np.unique(lat), np.unique(lon))
+        shape = (DAYS_IN_YEAR, len(self.hours), len(self.lats), len(self.lons))
+        flat = np.ravel_multi_index((day_of_year(times), np.searchsorted(self.hours, hour),
+                                     np.searchsorted(self.lats, lat), np.searchsorted(self.lons, lon)), shape)
+        size = int(np.prod(shape))
+        for field in self.fields:
+            values = _field_values(df, field)
+            if values is None:
+                continue
+            values = values.astype(np.float64)
+            ok = ~np.isnan(values)
+            keys, values = flat[ok], values[ok]
+            for part, weights in (('sum', values), ('sq', values ** 2), ('n', None)):
+                if (field, part) not in self._totals:
+                    self._totals[(field, part)] = np.zeros(shape, dtype=np.float64)
+                self._totals[(field, part)].reshape(-1)[:] += np.bincount(keys, weights=weights, minlength=size)
+        self.rows += len(df)
+        return self
+
+    @metrics.timed('build_climatology')
+    def build(self, load_block, block_rows):
+        """load_block(lats, lon_lo, lon_hi) trả về các dòng (time, latitude, longitude, trường...) của các ô
+        có latitude trong lats và longitude trong [lon_lo, lon_hi]."""
+        clim = Climatology(self.lats, self.lons, self.hours, self.window)
+        shape = (DAYS_IN_YEAR, len(clim.hours), len(clim.lats), len(clim.lons))
+        half = self.window // 2
+        for field in self.fields:
+            if (field, 'sum') not in self._totals:
+                continue
+            # Cộng dồn qua cửa sổ ngày (vòng qua cuối năm)
+            w_total, w_total_sq, w_count = (
+                sum(np.roll(self._totals[(field, part)], offset, axis=0) for offset in range(-half, half + 1))
+                for part in ('sum', 'sq', 'n'))
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean = w_total / w_count
+                var = np.maximum(w_total_sq / w_count - mean ** 2, 0) * w_count / (w_count - 1)
+            clim._stats[(field, 'mean')] = mean.astype(np.float32)
+            clim._stats[(field, 'std')] = np.sqrt(var).astype(np.float32)
+            clim.fields.append(field)
+
+        percentiles = {field: np.full((len(PERCENTILES),) + shape, np.nan, dtype=np.float32) for field in clim.fields}
+        n_cells = len(clim.lats) * len(clim.lons)
+        block_cells = max(1, int(block_rows * n_cells // max(self.rows, 1)))
+        for lats, lon_lo, lon_hi in _cell_blocks(clim.lats, clim.lons, block_cells):
+            block = load_block(lats, lon_lo, lon_hi)
+            if block.empty:
+                continue
+            bi = np.searchsorted(clim.lats, lats)
+            bj = np.arange(np.searchsorted(clim.lons, lon_lo), np.searchsorted(clim.lons, lon_hi) + 1)
+            for field in clim.fields:
+                percentiles[field][:, :, :, bi[:, None], bj[None, :]] = _window_percentiles(
+                    block, field, clim.hours, np.asarray(lats), clim.lons[bj], half)
+        for field in clim.fields:
+            for k, name in enumerate(PERCENTILES):
+                clim._stats[(field, name)] = percentiles[field][k]
+        return clim
+
+
+def _cell_blocks(lats, lons, block_cells):
+    """Chia lưới thành các khối (các latitude, lon_lo, lon_hi) có tối đa khoảng block_cells ô."""
+    if block_cells >= len(lons):
+        rows = max(1, block_cells // len(lons))
+        for start in range(0, len(lats), rows):
+            yield list(lats[start:start + rows]), lons[0], lons[-1]
+        return
+    for lat in lats:
+        for start in range(0, len(lons), block_cells):
+            part = lons[start:start + block_cells]
+            yield [lat], part[0], part[-1]
+
+
+def _window_percentiles(block, field, hours, lats, lons, half):
+    """Phân vị (len(PERCENTILES), 366, giờ, lat, lon) của các ô trong khối, trên cửa sổ ngày."""
+    times = pd.DatetimeIndex(block['time'])
+    years = times.year.to_numpy()
+    shape = (int(years.max() - years.min()) + 1, DAYS_IN_YEAR, len(hours), len(lats), len(lons))
+    values = _field_values(block, field)
+    if values is None:
+        return np.full((len(PERCENTILES),) + shape[1:], np.nan, dtype=np.float32)
+    samples = np.full(shape, np.nan, dtype=np.float32)
+    samples[years - years.min(), day_of_year(times), np.searchsorted(hours, times.hour.to_numpy()),
+            np.searchsorted(lats, block['latitude'].to_numpy()), np.searchsorted(lons, block['longitude'].to_numpy())] = values
+    # Mẫu của cửa sổ mọi ngày cùng lúc: (năm, 366, cửa sổ, ...) -> (năm * cửa sổ, 366, ...)
+    days = (np.arange(DAYS_IN_YEAR)[:, None] + np.arange(-half, half + 1)) % DAYS_IN_YEAR
+    window_samples = np.moveaxis(samples[:, days], 2, 1).reshape((-1,) + shape[1:])
+    return nan_percentiles(window_samples, PERCENTILES.values()).astype(np.float32)
+
+
+class Climatology:
+    """Chuẩn khí hậu theo (ngày trong năm, giờ, lat, lon): mean, std và các phân vị của từng trường.
+
+    Mỗi thống kê là một mảng dày (366, giờ, lat, lon) nên tra cứu cho một giá trị dự báo
+    chỉ là đánh chỉ số mảng.
+    """
+
+    def __init__(self, lats, lons, hours, window=WINDOW_DAYS):
+        self.lats = np.asarray(lats)
+        self.lons = np.asarray(lons)
+        self.hours = np.asarray(hours)
+        self.window = window
+        self.locator = GridLocator(self.lats, self.lons)
+        self.fields = []
+        self._stats = {}
+
+    @classmethod
+    def from_frame(cls, df, fields=CLIMATOLOGY_FIELDS, window=WINDOW_DAYS):
+        """Dựng từ một frame đã nạp sẵn (cả file); khi ingest dùng ClimatologyBuilder theo chunk."""
+        def load_block(lats, lon_lo, lon_hi):
+            lon = df['longitude']
+            return df[df['latitude'].isin(lats) & (lon >= lon_lo) & (lon <= lon_hi)]
+        return ClimatologyBuilder(fields, window).update(df).build(load_block, max(len(df), 1))
+
+    def save(self, path):
+        """Ghi mỗi mảng ra một file .npy để có thể memory-map khi nạp."""
+        os.makedirs(path, exist_ok=True)
+        arrays = {'lats': self.lats, 'lons': self.lons, 'hours': self.hours}
+        arrays.update({f'{stat}__{field}': arr for (field, stat), arr in self._stats.items()})
+        for name, arr in arrays.items():
+            np.save(os.path.join(path, f'{name}.npy'), arr)
+        with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'fields': self.fields, 'window': self.window}, f)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+
+        def read(name):
+            return np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode)
+
+        clim = cls(read('lats'), read('lons'), read('hours'), meta['window'])
+        clim.fields = meta['fields']
+        for field in clim.fields:
+            for stat in CLIMATOLOGY_STATS:
+                clim._stats[(field, stat)] = read(f'{stat}__{field}')
+        return clim
+
+    def lookup(self, field, stat, times, lats, lons):
+        """Giá trị chuẩn tại từng (time, lat, lon); NaN nếu giờ hoặc ô không có trong chuẩn khí hậu."""
+        times = pd.DatetimeIndex(np.atleast_1d(times))
+        d = day_of_year(times)
+        hours = times.hour.to_numpy()
+        h = np.clip(np.searchsorted(self.hours, hours), 0, len(self.hours) - 1)
+        i, j, ok = self.locator.nearest(np.broadcast_to(lats, d.shape), np.broadcast_to(lons, d.shape))
+        ok = ok & (self.hours[h] == hours)
+        return np.where(ok, self._stats[(field, stat)][d, h, i, j], np.nan)
+
+    def join(self, df, fields=None):
+        """Thêm <field>_normal, <field>_p10/_p90, <field>_anomaly và <field>_zscore cho mọi hàng của df."""
+        columns = {}
+        times, lats, lons = df['time'].to_numpy(), df['latitude'].to_numpy(), df['longitude'].to_numpy()
+        for field in fields or self.fields:
+            values = _field_values(df, field)
+            if field not in self.fields or values is None:
+                continue
+            normal = self.lookup(field, 'mean', times, lats, lons)
+            std = self.lookup(field, 'std', times, lats, lons)
+            anomaly = values - normal
+            columns[f'{field}_normal'] = normal
+            columns[f'{field}_p10'] = self.lookup(field, 'p10', times, lats, lons)
+            columns[f'{field}_p90'] = self.lookup(field, 'p90', times, lats, lons)
+            columns[f'{field}_anomaly'] = anomaly
+            with np.errstate(invalid='ignore', divide='ignore'):
+                columns[f'{field}_zscore'] = np.where(std > 0, anomaly / std, np.nan)
+        return df.assign(**columns)
@@ -0,0 +1,427 @@
+import os
+import json
+import shutil
+import hashlib
+import calendar
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.feather as feather
+from pyarrow.fs import LocalFileSystem
+
+import metrics
+from atomic_file import tmp_name, publish, write_json
+from grid_index import SORT_COLUMNS, GridLocator, sort_for_index
+from rollups import RollupCube
+from climatology import Climatology, ClimatologyBuilder
+
+# Thư mục lưu dữ liệu dạng cột (Arrow IPC) đã chuyển đổi từ CSV
+STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.weather_cache')
+FINGERPRINT_DIR = 'fingerprints'
+# Tăng khi bố cục store thay đổi để các file cũ không được dùng lại
+STORE_VERSION = 9
+MANIFEST_FILE = '_manifest.json'
+ROLLUP_FILES = {'M': '_rollup_monthly', 'W': '_rollup_weekly', 'D': '_rollup_daily'}
+CLIMATOLOGY_FILE = '_climatology'
+# Số dòng CSV đọc mỗi lần khi ingest
+CHUNK_ROWS = 500_000
+
+MEASUREMENT_COLUMNS = ['t2m', 'msl', 'tp', 'u10', 'v10']
+# Rename columns to match historical data format
+FORECAST_COLUMNS = {
+    'lat': 'latitude',
+    'lon': 'longitude',
+    '2m_temperature': 't2m',
+    'mean_sea_level_pressure': 'msl',
+    'total_precipitation_6hr': 'tp',
+    '10m_u_component_of_wind': 'u10',
+    '10m_v_component_of_wind': 'v10'
+}
+CALENDAR_DTYPES = {'hour': 'int8', 'month': 'int8', 'year': 'int16'}
+# Lược đồ gọn trong bộ nhớ: số đo float32, cột lịch số nguyên nhỏ, date là datetime64 (không phải
+# datetime.date từng dòng), tên thứ/tháng là categorical. latitude/longitude giữ float64 để so sánh
+# bằng (==) với tọa độ người dùng chọn không bị sai số làm tròn.
+COMPACT_DTYPES = {**{col: 'float32' for col in MEASUREMENT_COLUMNS}, **CALENDAR_DTYPES}
+# Phân vùng store theo năm/tháng để chỉ đọc phần dữ liệu đang xem
+PARTITIONING = ds.partitioning(pa.schema([('year', pa.int16()), ('month', pa.int8())]), flavor='hive')
+
+
+def _fingerprint_path(store_dir, source):
+    # Mỗi file nguồn một file fingerprint: các tiến trình ingest song song không ghi đè mục của nhau
+    name = hashlib.sha1(source.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(store_dir, FINGERPRINT_DIR, f"{name}.json")
+
+
+def _read_fingerprint(store_dir, source):
+    path = _fingerprint_path(store_dir, source)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_fingerprint(store_dir, source, entry):
+    write_json(_fingerprint_path(store_dir, source), entry)
+
+
+def cached_source_hash(csv_path, store_dir=STORE_DIR):
+    """SHA-1 đã lưu của file nguồn nếu size/mtime chưa đổi, ngược lại None (không băm file)."""
+    stat = os.stat(csv_path)
+    entry = _read_fingerprint(store_dir, os.path.abspath(csv_path))
+    if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+        return entry['sha1']
+    return None
+
+
+def source_hash(csv_path, store_dir=STORE_DIR, chunk_size=1 << 20):
+    """Trả về SHA-1 của file nguồn, chỉ băm lại khi size/mtime thay đổi."""
+    cached = cached_source_hash(csv_path, store_dir)
+    if cached is not None:
+        return cached
+    stat = os.stat(csv_path)
+    key = os.path.abspath(csv_path)
+
+    digest = hashlib.sha1()
+    with open(csv_path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            digest.update(block)
+    entry = {
+        'source': key,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha1': digest.hexdigest(),
+    }
+    _write_fingerprint(store_dir, key, entry)
+    return entry['sha1']
+
+
+def derive_calendar_columns(df):
+    # Dùng thuộc tính số của .dt thay cho strftime (chậm) để tạo các cột lịch
+    times = df['time'].dt
+    df['date'] = times.normalize()
+    df['hour'] = times.hour.astype(CALENDAR_DTYPES['hour'])
+    df['month'] = times.month.astype(CALENDAR_DTYPES['month'])
+    df['year'] = times.year.astype(CALENDAR_DTYPES['year'])
+    # calendar.day_name/month_name theo locale hiện tại, giống strftime('%A')/('%B')
+    day_names = list(calendar.day_name)
+    month_names = list(calendar.month_name)[1:]
+    df['day_name'] = pd.Categorical.from_codes(times.dayofweek.to_numpy(), categories=day_names)
+    df['month_name'] = pd.Categorical.from_codes(times.month.to_numpy() - 1, categories=month_names)
+    return df
+
+
+def prepare_historical_frame(df):
+    df['time'] = pd.to_datetime(df['time'])
+    for col in MEASUREMENT_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype(COMPACT_DTYPES[col])
+    derive_calendar_columns(df)
+    # Convert temperature from Kelvin to Celsius
+    if 't2m' in df.columns:
+        df['t2m'] = df['t2m'] - np.float32(273.15)
+    return df
+
+
+def prepare_forecast_frame(df):
+    return prepare_historical_frame(df.rename(columns=FORECAST_COLUMNS))
+
+
+def frame_from_table(table):
+    # split_blocks giữ mỗi cột số là một view trên bộ nhớ Arrow (memory-map), không gộp/copy.
+    # date_as_object=False: cột date32 (các lượt dự báo ghi trước đây) thành datetime64 thay vì datetime.date
+    return table.to_pandas(split_blocks=True, date_as_object=False)
+
+
+def store_path(csv_path, store_dir=STORE_DIR):
+    return os.path.join(store_dir, f"historical-v{STORE_VERSION}-{source_hash(csv_path, store_dir)[:16]}")
+
+
+def existing_store_path(csv_path, store_dir=STORE_DIR):
+    """Store đã dựng của file nguồn, hoặc None; không băm file nguồn và không dựng store."""
+    digest = cached_source_hash(csv_path, store_dir)
+    if digest is None:
+        return None
+    path = os.path.join(store_dir, f"historical-v{STORE_VERSION}-{digest[:16]}")
+    return path if os.path.exists(path) else None
+
+
+class ManifestBuilder:
+    """Gom thông tin nhẹ (năm/tháng/ngày, lưới, cột) qua từng chunk để dựng bộ chọn."""
+
+    def __init__(self):
+        self.dates = set()
+        self.latitudes = set()
+        self.longitudes = set()
+        self.columns = []
+
+    def update(self, df):
+        self.dates.update(df['time'].dt.normalize().unique())
+        self.latitudes.update(df['latitude'].unique().tolist())
+        self.longitudes.update(df['longitude'].unique().tolist())
+        self.columns = self.columns or list(df.columns)
+
+    def result(self):
+        dates = pd.DatetimeIndex(sorted(self.dates))
+        return {
+            'years': sorted(int(y) for y in dates.year.unique()),
+            'months': {
+                str(y): sorted(int(m) for m in dates[dates.year == y].month.unique())
+                for y in dates.year.unique()
+            },
+            'dates': [d.strftime('%Y-%m-%d') for d in dates],
+            'latitudes': sorted(float(v) for v in self.latitudes),
+            'longitudes': sorted(float(v) for v in self.longitudes),
+            'columns': self.columns,
+        }
+
+
+def write_partitioned(table, path, part=0):
+    ds.write_dataset(
+        table, path, format='ipc', partitioning=PARTITIONING,
+        basename_template=f'part-{part}-{{i}}.arrow', existing_data_behavior='overwrite_or_ignore',
+        preserve_order=True,
+    )
+
+
+def compact_partitions(path):
+    """Ghi lại mỗi phân vùng thành một file, một record batch, đã sắp xếp theo (lat, lon, time),
+    kèm cột year/month. Khi nạp, to_pandas không phải nối chunk hay tạo cột phân vùng nên mọi cột
+    là view zero-copy trên file memory-map (dùng chung page cache giữa các tiến trình)."""
+    for root, _, files in os.walk(path):
+        parts = sorted(f for f in files if f.endswith('.arrow'))
+        if not parts:
+            continue
+        # Đọc memory-map: bộ cấp phát của Arrow không giữ lại trang nhớ của từng phân vùng đã đọc
+        table = pa.concat_tables([feather.read_table(os.path.join(root, f), memory_map=True) for f in parts])
+        table = table.sort_by([(col, 'ascending') for col in SORT_COLUMNS])
+        # write_dataset bỏ cột phân vùng khỏi file; ghi lại để không phải cấp phát chúng khi nạp
+        values = dict(segment.split('=', 1) for segment in os.path.relpath(root, path).split(os.sep))
+        for field in PARTITIONING.schema:
+            table = table.append_column(field, pa.array(np.full(table.num_rows, int(values[field.name])),
+                                                        type=field.type))
+        tmp_file = tmp_name(os.path.join(root, 'part-0.arrow'))
+        feather.write_feather(table, tmp_file, compression='uncompressed', chunksize=max(table.num_rows, 1))
+        for f in parts:
+            os.remove(os.path.join(root, f))
+        os.replace(tmp_file, os.path.join(root, 'part-0.arrow'))
+
+
+class CellRuns:
+    """Bản tạm theo thứ tự ô lưới cho ClimatologyBuilder.build(): mỗi chunk ingest là một file đã sắp
+    xếp theo (lat, lon, time). Dòng của một khối ô là một khoảng liên tục trong mỗi file, tìm bằng
+    searchsorted trên file memory-map, nên mỗi khối chỉ đọc dòng của chính nó thay vì quét cả store."""
+
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = columns
+        self.files = []
+        self._runs = None
+        os.makedirs(path, exist_ok=True)
+
+    def append(self, df):
+        run_path = os.path.join(self.path, f"run-{len(self.files)}.arrow")
+        table = pa.Table.from_pandas(df[[c for c in self.columns if c in df.columns]], preserve_index=False)
+        feather.write_feather(table, run_path, compression='uncompressed', chunksize=max(table.num_rows, 1))
+        self.files.append(run_path)
+
+    def load_block(self, lats, lon_lo, lon_hi):
+        if self._runs is None:
+            self._runs = []
+            for run_path in self.files:
+                table = feather.read_table(run_path, memory_map=True)
+                self._runs.append((table, table['latitude'].to_numpy(), table['longitude'].to_numpy()))
+        slices = []
+        for table, lat, lon in self._runs:
+            for value in lats:
+                start, stop = np.searchsorted(lat, value, 'left'), np.searchsorted(lat, value, 'right')
+                lo = start + np.searchsorted(lon[start:stop], lon_lo, 'left')
+                hi = start + np.searchsorted(lon[start:stop], lon_hi, 'right')
+                if hi > lo:
+                    slices.append(table.slice(lo, hi - lo))
+        if not slices:
+            return pd.DataFrame(columns=self.columns)
+        return frame_from_table(pa.concat_tables(slices))
+
+    def close(self):
+        self._runs = None
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+@metrics.timed('build_historical_store')
+def build_historical_store(csv_path, store_dir=STORE_DIR, chunk_rows=CHUNK_ROWS):
+    """Ingest CSV theo từng chunk: đổi đơn vị, tạo cột lịch, ghi store Arrow IPC
+    chia theo năm/tháng và cập nhật bảng tổng hợp. Dữ liệu thô không bao giờ nằm hết trong bộ nhớ:
+    bộ nhớ đỉnh gồm một chunk (chunk_rows) cộng các bảng tổng hợp, vốn tỉ lệ với số bucket thời gian
+    nhân số ô lưới (bảng theo ngày lớn nhất), và tổng tích lũy của chuẩn khí hậu (theo lưới)."""
+    os.makedirs(store_dir, exist_ok=True)
+    path = store_path(csv_path, store_dir)
+    tmp_path = tmp_name(path)
+
+    manifest = ManifestBuilder()
+    cubes = {freq: RollupCube(freq) for freq in ROLLUP_FILES}
+    climatology = ClimatologyBuilder()
+    cell_runs = CellRuns(tmp_name(os.path.join(store_dir, 'cell-runs')),
+                         ['time', 'latitude', 'longitude'] + MEASUREMENT_COLUMNS)
+    try:
+        for part, chunk in enumerate(pd.read_csv(csv_path, chunksize=chunk_rows)):
+            chunk = sort_for_index(prepare_historical_frame(chunk))
+            write_partitioned(pa.Table.from_pandas(chunk, preserve_index=False), tmp_path, part)
+            manifest.update(chunk)
+            for cube in cubes.values():
+                cube.update(chunk)
+            climatology.update(chunk)
+            cell_runs.append(chunk)
+
+        os.makedirs(tmp_path, exist_ok=True)
+        compact_partitions(tmp_path)
+        with open(os.path.join(tmp_path, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+            json.dump(manifest.result(), f)
+        for freq, cube in cubes.items():
+            cube.save(os.path.join(tmp_path, ROLLUP_FILES[freq]))
+        # Phân vị cần mọi năm của từng ô: đọc theo từng khối ô (khoảng chunk_rows dòng) từ bản tạm theo ô
+        climatology.build(cell_runs.load_block, chunk_rows).save(os.path.join(tmp_path, CLIMATOLOGY_FILE))
+    finally:
+        cell_runs.close()
+    publish(tmp_path, path)
+    return path
+
+
+def _ensure_store(csv_path, store_dir):
+    os.makedirs(store_dir, exist_ok=True)
+    path = store_path(csv_path, store_dir)
+    if not os.path.exists(path):
+        build_historical_store(csv_path, store_dir)
+    return path
+
+
+def historical_manifest(csv_path, store_dir=STORE_DIR):
+    """Danh sách năm/tháng/ngày và lưới lat/lon của dữ liệu lịch sử."""
+    path = _ensure_store(csv_path, store_dir)
+    with open(os.path.join(path, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_rollups(csv_path, store_dir=STORE_DIR):
+    """Bảng tổng hợp (theo tháng, theo ngày) được tạo sẵn khi ingest."""
+    return load_rollup(csv_path, 'M', store_dir), load_rollup(csv_path, 'D', store_dir)
+
+
+def load_rollup(csv_path, freq, store_dir=STORE_DIR):
+    """Bảng tổng hợp theo một tần suất ('D', 'W', 'M'), memory-map từ store."""
+    path = _ensure_store(csv_path, store_dir)
+    return RollupCube.load(os.path.join(path, ROLLUP_FILES[freq]))
+
+
+def load_climatology(csv_path, store_dir=STORE_DIR):
+    """Chuẩn khí hậu theo (ngày trong năm, giờ, ô lưới), memory-map từ store."""
+    return store_climatology(_ensure_store(csv_path, store_dir))
+
+
+def store_climatology(path):
+    """Chuẩn khí hậu của một store đã dựng (xem existing_store_path)."""
+    return Climatology.load(os.path.join(path, CLIMATOLOGY_FILE))
+
+
+def _combine(conditions):
+    expr = None
+    for condition in conditions:
+        expr = condition if expr is None else expr & condition
+    return expr
+
+
+def _partition_filter(years, months, start=None, end=None):
+    # Điều kiện trên cột phân vùng (year/month): chỉ dùng để chọn file, không lọc theo dòng
+    conditions = []
+    if years is not None:
+        conditions.append(ds.field('year').isin(list(years)))
+    if months is not None:
+        conditions.append(ds.field('month').isin(list(months)))
+    if start is not None:
+        conditions.append(ds.field('year') >= pd.Timestamp(start).year)
+    if end is not None:
+        conditions.append(ds.field('year') <= pd.Timestamp(end).year)
+    return _combine(conditions)
+
+
+def _row_filter(start=None, end=None, lat=None, lon=None):
+    # Điều kiện lọc theo dòng khi quét; None nếu lấy nguyên các phân vùng (không copy)
+    conditions = []
+    if start is not None:
+        conditions.append(ds.field('time') >= pd.Timestamp(start).to_pydatetime())
+    if end is not None:
+        conditions.append(ds.field('time') < pd.Timestamp(end).to_pydatetime())
+    if lat is not None:
+        conditions.append(ds.field('latitude') == lat)
+    if lon is not None:
+        conditions.append(ds.field('longitude') == lon)
+    return _combine(conditions)
+
+
+@metrics.timed('load_historical')
+def load_historical(csv_path, store_dir=STORE_DIR, years=None, months=None,
+                    start=None, end=None, lat=None, lon=None):
+    """Nạp dữ liệu lịch sử từ store (memory-map), chuyển đổi CSV nếu chưa có.
+
+    years/months giới hạn các phân vùng được đọc; các phân vùng khác không bị chạm tới.
+    start/end (time trong [start, end)) và lat/lon lọc thêm theo dòng khi quét; lat/lon được
+    đưa về ô lưới gần nhất trước (bảng rỗng nếu nằm ngoài lưới). Không lọc theo dòng thì một
+    phân vùng được trả về dạng view trên file, không cấp phát bộ nhớ.
+    """
+    path = _ensure_store(csv_path, store_dir)
+    filesystem = LocalFileSystem(use_mmap=True)
+    dataset = ds.dataset(path, format='ipc', partitioning=PARTITIONING, filesystem=filesystem)
+    if lat is not None or lon is not None:
+        # So sánh bằng (==) trên float chỉ đúng với tọa độ đúng của lưới
+        manifest = historical_manifest(csv_path, store_dir)
+        lats, lons = manifest['latitudes'], manifest['longitudes']
+        i, j, ok = GridLocator(lats, lons).nearest(lats[0] if lat is None else lat, lons[0] if lon is None else lon)
+        if not ok:
+            return frame_from_table(dataset.schema.empty_table())
+        lat = None if lat is None else lats[int(i)]
+        lon = None if lon is None else lons[int(j)]
+    # Đọc các file đã chọn không qua partitioning: year/month lấy từ cột trong file thay vì
+    # được tạo mới từ đường dẫn
+    files = [fragment.path for fragment in dataset.get_fragments(filter=_partition_filter(years, months, start, end))]
+    if not files:
+        return frame_from_table(dataset.schema.empty_table())
+    table = ds.dataset(files, format='ipc', filesystem=filesystem).to_table(filter=_row_filter(start, end, lat, lon))
+    return frame_from_table(table)
+
+
+def forecast_store_path(csv_path, store_dir=STORE_DIR):
+    return os.path.join(store_dir, f"forecast-v{STORE_VERSION}-{source_hash(csv_path, store_dir)[:16]}.arrow")
+
+
+def write_frame(df, path):
+    """Ghi frame ra file Arrow IPC không nén (ghi file tạm rồi đổi tên)."""
+    tmp_path = tmp_name(path)
+    # Một record batch duy nhất để to_pandas không phải nối (copy) các chunk
+    feather.write_feather(pa.Table.from_pandas(df, preserve_index=False), tmp_path,
+                          compression='uncompressed', chunksize=max(len(df), 1))
+    publish(tmp_path, path)
+
+
+def read_frame(path):
+    return frame_from_table(feather.read_table(path, memory_map=True))
+
+
+def load_forecast(csv_path, store_dir=STORE_DIR):
+    """Nạp dữ liệu dự báo từ file Arrow IPC (memory-map), chuyển đổi CSV nếu chưa có."""
+    os.makedirs(store_dir, exist_ok=True)
+    path = forecast_store_path(csv_path, store_dir)
+    if not os.path.exists(path):
+        write_frame(sort_for_index(prepare_forecast_frame(pd.read_csv(csv_path))), path)
+    return read_frame(path)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Ingest historical ERA5 CSV into the columnar store.')
+    parser.add_argument('csv_path')
+    parser.add_argument('--store-dir', default=STORE_DIR)
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+    print(build_historical_store(args.csv_path, args.store_dir, args.chunk_rows))
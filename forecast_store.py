@@ -0,0 +1,161 @@
+import os
+import json
+import time
+import glob
+import hashlib
+import logging
+import fnmatch
+import threading
+
+import pandas as pd
+
+import data_store
+import metrics
+from atomic_file import write_json
+from grid_index import sort_for_index
+
+logger = logging.getLogger(__name__)
+
+FORECAST_RUNS_DIR = os.path.join(data_store.STORE_DIR, 'forecast_runs')
+RUN_TIME_FORMAT = '%Y%m%dT%H%M'
+# Mỗi file nguồn một file {source, run_id} (lượt đã ingest từ nó), để ingest lại cùng file (vd. bản sửa)
+# thay thế lượt cũ; các tiến trình ingest các nguồn khác nhau không ghi đè mục của nhau
+SOURCES_DIR = 'sources'
+
+
+def run_issue_time(run_id):
+    """Thời điểm phát hành của một lượt dự báo, lấy từ id 'YYYYmmddTHHMM-<hash>'."""
+    return pd.to_datetime(run_id.split('-', 1)[0], format=RUN_TIME_FORMAT)
+
+
+class ForecastStore:
+    """Lưu mỗi lượt dự báo (model run) thành một file Arrow IPC riêng, khóa theo thời điểm phát hành.
+
+    Ingest file mới chỉ tốn chi phí của chính file đó; các lượt cũ không bị parse lại.
+    Ingest lại cùng một file nguồn với nội dung khác thay thế lượt trước đó của file này.
+    """
+
+    def __init__(self, root_dir=FORECAST_RUNS_DIR):
+        self.root_dir = root_dir
+        os.makedirs(root_dir, exist_ok=True)
+
+    def _path(self, run_id):
+        return os.path.join(self.root_dir, f"run-{run_id}.arrow")
+
+    def runs(self):
+        """Id các lượt dự báo, mới nhất trước; cùng thời điểm phát hành thì lượt ingest sau đứng trước."""
+        ingested = {}
+        for p in glob.glob(os.path.join(self.root_dir, 'run-*.arrow')):
+            try:
+                ingested[os.path.basename(p)[len('run-'):-len('.arrow')]] = os.stat(p).st_mtime_ns
+            except FileNotFoundError:  # vừa bị thay thế
+                continue
+        return sorted(ingested, key=lambda r: (run_issue_time(r), ingested[r], r), reverse=True)
+
+    def latest(self):
+        runs = self.runs()
+        return runs[0] if runs else None
+
+    def find(self, csv_path):
+        # Lượt đã ingest từ đúng nội dung file này (theo hash), nếu có
+        digest = data_store.source_hash(csv_path, self.root_dir)[:16]
+        for run_id in self.runs():
+            if run_id.endswith(f"-{digest}"):
+                return run_id
+        return None
+
+    def _source_path(self, source):
+        name = hashlib.sha1(source.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.root_dir, SOURCES_DIR, f"{name}.json")
+
+    def _read_sources(self):
+        """{file nguồn: id lượt} của mọi nguồn đã ingest."""
+        sources = {}
+        for path in glob.glob(os.path.join(self.root_dir, SOURCES_DIR, '*.json')):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):  # vừa bị thay thế
+                continue
+            sources[entry['source']] = entry['run_id']
+        return sources
+
+    @metrics.timed('ingest_forecast')
+    def ingest(self, csv_path, issue_time=None):
+        """Thêm một file dự báo thành lượt mới; bỏ qua nếu nội dung đã có. Trả về id lượt.
+
+        issue_time mặc định là thời điểm dự báo sớm nhất trong file.
+        """
+        run_id = self.find(csv_path)
+        if run_id is not None:
+            return run_id
+        df = sort_for_index(data_store.prepare_forecast_frame(pd.read_csv(csv_path)))
+        issue_time = pd.Timestamp(issue_time) if issue_time is not None else df['time'].min()
+        digest = data_store.source_hash(csv_path, self.root_dir)[:16]
+        run_id = f"{issue_time.strftime(RUN_TIME_FORMAT)}-{digest}"
+        data_store.write_frame(df, self._path(run_id))
+
+        source = os.path.abspath(csv_path)
+        previous = self._read_sources().get(source)
+        write_json(self._source_path(source), {'source': source, 'run_id': run_id})
+        if previous is not None and previous != run_id and previous not in self._read_sources().values():
+            try:
+                os.remove(self._path(previous))
+            except OSError:
+                pass  # Windows: file đang được memory-map
+        return run_id
+
+    @metrics.timed('load_forecast_run')
+    def load_run(self, run_id):
+        """Frame của một lượt dự báo (memory-map, không copy)."""
+        return data_store.read_frame(self._path(run_id))
+
+
+class ForecastWatcher(threading.Thread):
+    """Theo dõi thư mục (polling) và ingest các file dự báo mới hoặc vừa thay đổi."""
+
+    def __init__(self, store, directory, pattern='*.csv', interval=60, settle_seconds=None):
+        super().__init__(name='forecast-watcher', daemon=True)
+        self.store = store
+        self.directory = directory
+        self.pattern = pattern
+        self.interval = interval
+        # File chỉ được ingest khi (size, mtime) không đổi qua hai lần quét, hoặc đã không
+        # bị sửa trong settle_seconds, để không ingest file đang được chép dở
+        self.settle_seconds = interval if settle_seconds is None else settle_seconds
+        self._seen = {}
+        self._pending = {}
+        self._stop_event = threading.Event()
+
+    def poll(self):
+        """Quét thư mục một lần; trả về id các lượt vừa ingest."""
+        ingested = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file() or not fnmatch.fnmatch(entry.name, self.pattern):
+                continue
+            stat = entry.stat()
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if self._seen.get(entry.path) == signature:
+                continue
+            settled = time.time() - stat.st_mtime >= self.settle_seconds
+            if self._pending.get(entry.path) != signature and not settled:
+                self._pending[entry.path] = signature
+                continue
+            self._pending.pop(entry.path, None)
+            try:
+                ingested.append(self.store.ingest(entry.path))
+            except (OSError, ValueError, KeyError) as e:
+                # File đang được ghi dở hoặc sai định dạng: thử lại ở lượt quét sau
+                logger.warning("Skipping forecast file %s: %s", entry.path, e)
+                continue
+            self._seen[entry.path] = signature
+        return ingested
+
+    def run(self):
+        while not self._stop_event.is_set():
+            if os.path.isdir(self.directory):
+                self.poll()
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
@@ -0,0 +1,240 @@
+import numpy as np
+import pandas as pd
+
+import metrics
+
+SORT_COLUMNS = ['latitude', 'longitude', 'time']
+
+
+def sort_for_index(df):
+    # Sắp xếp theo (lat, lon, time) để mỗi ô lưới là một khoảng hàng liên tục
+    return df.sort_values(SORT_COLUMNS, kind='stable', ignore_index=True)
+
+
+class GridLocator:
+    """Tra tọa độ bất kỳ về lưới đều (lats, lons tăng dần) bằng searchsorted, không quét bảng.
+
+    Mọi hàm nhận scalar hoặc mảng tọa độ; điểm cách lưới quá nửa bước coi như nằm ngoài lưới.
+    """
+
+    def __init__(self, lats, lons):
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self._lat_tol = self._half_step(self.lats)
+        self._lon_tol = self._half_step(self.lons)
+
+    @staticmethod
+    def _half_step(axis):
+        # Lưới một điểm: chỉ chấp nhận sai số làm tròn
+        return float(np.min(np.diff(axis))) / 2 if len(axis) > 1 else 1e-6
+
+    @staticmethod
+    def _nearest(axis, values):
+        i = np.clip(np.searchsorted(axis, values), 1, max(len(axis) - 1, 1))
+        left = axis[i - 1]
+        right = axis[np.minimum(i, len(axis) - 1)]
+        return np.where(np.abs(values - left) <= np.abs(right - values), i - 1, np.minimum(i, len(axis) - 1))
+
+    def nearest(self, lat, lon):
+        """(i, j, ok): chỉ số ô gần nhất và mặt nạ các điểm nằm trong lưới."""
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        if len(self.lats) == 0 or len(self.lons) == 0:
+            empty = np.zeros(np.broadcast(lat, lon).shape, dtype=np.int64)
+            return empty, empty, empty.astype(bool)
+        i = self._nearest(self.lats, lat)
+        j = self._nearest(self.lons, lon)
+        ok = (np.abs(self.lats[i] - lat) <= self._lat_tol) & (np.abs(self.lons[j] - lon) <= self._lon_tol)
+        return i, j, ok
+
+    def cell(self, lat, lon):
+        """(i, j) của ô gần (lat, lon), hoặc None nếu điểm nằm ngoài lưới."""
+        i, j, ok = self.nearest(lat, lon)
+        return (int(i), int(j)) if ok else None
+
+    def snap(self, lat, lon):
+        """Tọa độ ô lưới gần nhất, hoặc None nếu điểm nằm ngoài lưới."""
+        cell = self.cell(lat, lon)
+        return None if cell is None else (float(self.lats[cell[0]]), float(self.lons[cell[1]]))
+
+    @staticmethod
+    def _bracket(axis, values):
+        # Ô chứa điểm: axis[i0] <= v <= axis[i0 + 1], t là vị trí tương đối trong ô
+        if len(axis) == 1:
+            zero = np.zeros(values.shape, dtype=np.int64)
+            return zero, zero, np.zeros(values.shape), np.isclose(values, axis[0])
+        i0 = np.clip(np.searchsorted(axis, values, side='right') - 1, 0, len(axis) - 2)
+        t = (values - axis[i0]) / (axis[i0 + 1] - axis[i0])
+        inside = (t >= 0) & (t <= 1)
+        return i0, i0 + 1, np.clip(t, 0, 1), inside
+
+    def interpolate(self, values, lat, lon):
+        """Nội suy song tuyến tính values (..., lat, lon) tại các điểm; kết quả có shape (..., n_điểm).
+
+        Góc ô bị NaN được bỏ qua (chuẩn hóa lại trọng số); điểm ngoài lưới cho NaN.
+        """
+        lat = np.atleast_1d(np.asarray(lat, dtype=np.float64))
+        lon = np.atleast_1d(np.asarray(lon, dtype=np.float64))
+        i0, i1, ty, inside_lat = self._bracket(self.lats, lat)
+        j0, j1, tx, inside_lon = self._bracket(self.lons, lon)
+        values = np.asarray(values)
+        total = np.zeros(values.shape[:-2] + lat.shape, dtype=np.float64)
+        weight = np.zeros_like(total)
+        for i, j, w in ((i0, j0, (1 - ty) * (1 - tx)), (i0, j1, (1 - ty) * tx),
+                        (i1, j0, ty * (1 - tx)), (i1, j1, ty * tx)):
+            corner = values[..., i, j]
+            ok = ~np.isnan(corner) & (w > 0)
+            total += np.where(ok, corner * w, 0)
+            weight += np.where(ok, w, 0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result = total / weight
+        result[..., ~(inside_lat & inside_lon)] = np.nan
+        return result
+
+
+class GridIndex:
+    """Chỉ mục (lat, lon) -> khoảng hàng liên tục, thời gian tăng dần trong mỗi ô."""
+
+    @metrics.timed('build_grid_index')
+    def __init__(self, df):
+        if not self._is_sorted(df):
+            df = sort_for_index(df)
+        lat = df['latitude'].to_numpy()
+        lon = df['longitude'].to_numpy()
+        self.frame = df
+        self.lats = np.unique(lat)
+        self.lons = np.unique(lon)
+        self.locator = GridLocator(self.lats, self.lons)
+        self._times = df['time'].to_numpy()
+
+        # offsets[c]..offsets[c+1] là khoảng hàng của ô c = i_lat * n_lon + i_lon
+        cell_ids = self._cell_ids(lat, lon)
+        counts = np.bincount(cell_ids, minlength=len(self.lats) * len(self.lons))
+        self.offsets = np.concatenate(([0], np.cumsum(counts)))
+
+        unique_times = pd.DatetimeIndex(np.unique(self._times))
+        self.years = sorted(int(y) for y in unique_times.year.unique())
+        self.dates = sorted(set(unique_times.date))
+        self._months = {
+            year: sorted(int(m) for m in unique_times[unique_times.year == year].month.unique())
+            for year in self.years
+        }
+
+    def _cell_ids(self, lat, lon):
+        return np.searchsorted(self.lats, lat) * len(self.lons) + np.searchsorted(self.lons, lon)
+
+    @staticmethod
+    def _is_sorted(df):
+        lat = df['latitude'].to_numpy()
+        lon = df['longitude'].to_numpy()
+        times = df['time'].to_numpy()
+        same_lat = lat[1:] == lat[:-1]
+        same_cell = same_lat & (lon[1:] == lon[:-1])
+        return bool(
+            np.all(lat[1:] >= lat[:-1])
+            and np.all(lon[1:][same_lat] >= lon[:-1][same_lat])
+            and np.all(times[1:][same_cell] >= times[:-1][same_cell])
+        )
+
+    def months(self, year):
+        return self._months.get(year, [])
+
+    def _cell_bounds(self, lat, lon):
+        # Tọa độ được đưa về ô lưới gần nhất nên lệch làm tròn của slider/nhập tay vẫn tìm được ô
+        cell = self.locator.cell(lat, lon)
+        if cell is None:
+            return 0, 0
+        cell = cell[0] * len(self.lons) + cell[1]
+        return self.offsets[cell], self.offsets[cell + 1]
+
+    @metrics.timed('point_lookup')
+    def point(self, lat, lon, start=None, end=None):
+        """Các hàng của ô (lat, lon) có time trong [start, end)."""
+        lo, hi = self._cell_bounds(lat, lon)
+        if start is not None:
+            lo = lo + np.searchsorted(self._times[lo:hi], np.datetime64(pd.Timestamp(start)), side='left')
+        if end is not None:
+            hi = lo + np.searchsorted(self._times[lo:hi], np.datetime64(pd.Timestamp(end)), side='left')
+        return self.frame.iloc[lo:hi]
+
+    def point_year(self, lat, lon, year):
+        return self.point(lat, lon, pd.Timestamp(int(year), 1, 1), pd.Timestamp(int(year) + 1, 1, 1))
+
+    def point_month(self, lat, lon, year, month):
+        start = pd.Timestamp(int(year), int(month), 1)
+        return self.point(lat, lon, start, start + pd.offsets.MonthBegin(1))
+
+    def point_date(self, lat, lon, date):
+        start = pd.Timestamp(date)
+        return self.point(lat, lon, start, start + pd.Timedelta(days=1))
+
+
+# Trường tính từ các cột gốc khi dựng lưới dày
+DERIVED_FIELDS = {
+    'wind': (('u10', 'v10'), lambda u, v: np.hypot(u, v)),
+}
+
+
+class GridSlices:
+    """Mảng dày (time, lat, lon) của từng trường, dựng một lần từ GridIndex.
+
+    Lấy bản đồ của một thời điểm hay một kỳ chỉ là cắt mảng, không phải lọc rồi pivot frame.
+    """
+
+    @metrics.timed('build_grid_slices')
+    def __init__(self, index, fields):
+        frame = index.frame
+        self.lats, self.lons = index.lats, index.lons
+        self.locator = index.locator
+        self.times = np.unique(index._times)
+        n_cells = len(self.lats) * len(self.lons)
+        cell = np.repeat(np.arange(n_cells), np.diff(index.offsets))
+        flat = np.searchsorted(self.times, index._times) * n_cells + cell
+        shape = (len(self.times), len(self.lats), len(self.lons))
+
+        self.fields = []
+        self._arrays = {}
+        for field in fields:
+            if field in DERIVED_FIELDS:
+                inputs, derive = DERIVED_FIELDS[field]
+                if not all(c in frame.columns for c in inputs):
+                    continue
+                values = derive(*(frame[c].to_numpy(np.float32) for c in inputs))
+            elif field in frame.columns:
+                values = frame[field].to_numpy(np.float32)
+            else:
+                continue
+            arr = np.full(shape[0] * n_cells, np.nan, dtype=np.float32)
+            arr[flat] = values
+            self._arrays[field] = arr.reshape(shape)
+            self.fields.append(field)
+        self._periods = {}
+
+    def periods(self, field, freq, how='mean'):
+        """(thời điểm bắt đầu, mảng (kỳ, lat, lon)) gộp theo freq: '6h' (gốc), 'D' hoặc 'M'."""
+        if freq == '6h':
+            return self.times, self._arrays[field]
+        key = (field, freq, how)
+        if key not in self._periods:
+            arr = self._arrays[field]
+            buckets = self.times.astype(f'datetime64[{freq}]')
+            starts, first = np.unique(buckets, return_index=True)
+            ok = ~np.isnan(arr)
+            total = np.add.reduceat(np.where(ok, arr, 0), first, axis=0, dtype=np.float64)
+            count = np.add.reduceat(ok, first, axis=0, dtype=np.int32)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                reduced = np.where(count > 0, total if how == 'sum' else total / count, np.nan)
+            self._periods[key] = (starts.astype('datetime64[ns]'), reduced.astype(np.float32))
+        return self._periods[key]
+
+    def interpolate(self, field, lats, lons, freq='6h', how='mean'):
+        """(thời điểm, mảng (kỳ, n_điểm)) nội suy song tuyến tính tại các tọa độ bất kỳ."""
+        starts, arr = self.periods(field, freq, how)
+        return starts, self.locator.interpolate(arr, lats, lons)
+
+    def limits(self, field, freq, how='mean'):
+        # Thang màu cố định cho mọi kỳ để khi kéo thanh thời gian màu sắc so sánh được với nhau
+        _, arr = self.periods(field, freq, how)
+        if np.isnan(arr).all():
+            return 0.0, 1.0
+        return float(np.nanmin(arr)), float(np.nanmax(arr))
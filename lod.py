@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+
+import metrics
+
+# Số điểm tối đa gửi cho một biểu đồ
+MAX_POINTS = 2000
+# Mức chi tiết từ mịn tới thô: (tên, bước thời gian của một điểm)
+LEVELS = [
+    ('6h', pd.Timedelta(hours=6)),
+    ('D', pd.Timedelta(days=1)),
+    ('W', pd.Timedelta(weeks=1)),
+    ('M', pd.Timedelta(days=30)),
+]
+
+
+def lttb(x, y, n_out):
+    """Largest-Triangle-Three-Buckets: chọn n_out chỉ số giữ được hình dạng chuỗi (x, y)."""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # Biên các bucket cho các điểm ở giữa (điểm đầu và cuối luôn được giữ)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Điểm trung bình của bucket kế tiếp
+        next_lo, next_hi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_lo:next_hi].mean()
+        avg_y = y[next_lo:next_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.nanargmax(area)) if np.any(~np.isnan(area)) else lo
+        selected[i + 1] = a
+    return selected
+
+
+def choose_level(start, end, max_points=MAX_POINTS):
+    """Mức chi tiết mịn nhất mà khoảng [start, end) không vượt quá max_points điểm.
+
+    Dữ liệu 6 giờ phải quét cả phân vùng để lấy một ô, nên chỉ dùng khi bản thân nó đã vừa max_points;
+    khoảng dài hơn đọc từ rollup theo ngày trước khi chuyển sang tuần.
+    """
+    span = pd.Timestamp(end) - pd.Timestamp(start)
+    for name, step in LEVELS:
+        if span / step <= max_points:
+            return name
+    return LEVELS[-1][0]
+
+
+class LodSeries:
+    """Chuỗi thời gian nhiều mức chi tiết cho một trường tại một ô lưới.
+
+    Mức 6h đọc trực tiếp dữ liệu gốc của ô qua load_raw(lat, lon, start, end);
+    các mức D/W/M đọc từ RollupCube (min/max/mean) đã tạo sẵn.
+    """
+
+    def __init__(self, cubes, load_raw, max_points=MAX_POINTS):
+        self.cubes = cubes
+        self.load_raw = load_raw
+        self.max_points = max_points
+
+    @metrics.timed('lod_series')
+    def series(self, field, lat, lon, start, end):
+        """DataFrame (time, min, max, mean) với tối đa max_points điểm, và tên mức đã dùng."""
+        level = choose_level(start, end, self.max_points)
+        if level == '6h':
+            raw = self.load_raw(lat, lon, start, end).sort_values('time')
+            values = raw[field].to_numpy(np.float64)
+            result = pd.DataFrame({'time': raw['time'].to_numpy(), 'min': values, 'max': values, 'mean': values})
+        else:
+            cube = self.cubes[level]
+            stats = cube.point_stats(lat, lon, start, end, {
+                'min': (field, 'min'), 'max': (field, 'max'), 'mean': (field, 'mean')})
+            stats.insert(0, 'time', cube.bucket_start(stats.pop('bucket').to_numpy()))
+            result = stats
+        if len(result) > self.max_points:
+            keep = lttb(result['time'].to_numpy().astype('datetime64[s]').astype(np.int64),
+                        result['mean'].to_numpy(), self.max_points)
+            result = result.iloc[keep]
+        return result.reset_index(drop=True), level
@@ -0,0 +1,227 @@
+"""Đo thời gian các bước xử lý (span) và bộ nhớ, xuất ra bảng debug hoặc định dạng Prometheus."""
+import os
+import sys
+import time
+import atexit
+import threading
+import functools
+from collections import deque
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import numpy as np
+import pandas as pd
+
+from atomic_file import write_text
+
+# Số mẫu gần nhất giữ lại cho mỗi span để tính p50/p95
+SAMPLE_WINDOW = 1024
+QUANTILES = (0.5, 0.95)
+METRIC_PREFIX = 'weather'
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, **extra):
+    items = list(key) + list(extra.items())
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in items) + '}'
+
+
+class Metrics:
+    """Registry span/gauge dùng chung trong tiến trình, an toàn với nhiều thread.
+
+    Mỗi thread có thể bật một trace (start_trace/end_trace) để lấy danh sách span của riêng
+    một lần chạy, vd. một lần rerun của Streamlit.
+    """
+
+    def __init__(self, window=SAMPLE_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._totals = {}
+        self._gauges = {}
+        self._local = threading.local()
+
+    def observe(self, name, seconds, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            if key not in self._samples:
+                self._samples[key] = deque(maxlen=self.window)
+                self._totals[key] = [0, 0.0]
+            self._samples[key].append(seconds)
+            self._totals[key][0] += 1
+            self._totals[key][1] += seconds
+        trace = getattr(self._local, 'trace', None)
+        if trace is not None:
+            trace.append((name, labels, seconds))
+
+    def span(self, name, **labels):
+        return _Span(self, name, labels)
+
+    def timed(self, name):
+        """Decorator: mỗi lần gọi hàm là một span."""
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = value
+
+    def start_trace(self):
+        self._local.trace = []
+
+    def end_trace(self):
+        """Danh sách (span, labels, giây) ghi được từ start_trace trên thread hiện tại."""
+        trace = getattr(self._local, 'trace', None) or []
+        self._local.trace = None
+        return trace
+
+    def summary(self):
+        """{(span, labels): {'count', 'sum', 'p50', 'p95'}} trên cửa sổ mẫu gần nhất."""
+        with self._lock:
+            snapshot = {key: (np.array(samples), list(self._totals[key])) for key, samples in self._samples.items()}
+        result = {}
+        for key, (samples, (count, total)) in snapshot.items():
+            stats = {'count': count, 'sum': total}
+            for q in QUANTILES:
+                stats[f'p{int(q * 100)}'] = float(np.quantile(samples, q))
+            result[key] = stats
+        return result
+
+    def gauges(self):
+        with self._lock:
+            return dict(self._gauges)
+
+    def prometheus_text(self, **const_labels):
+        """Các span dạng summary và gauge theo định dạng text exposition của Prometheus;
+        const_labels (vd. pid) được thêm vào mọi chuỗi."""
+        const = tuple(sorted(const_labels.items()))
+        span_metric = f'{METRIC_PREFIX}_span_seconds'
+        lines = [f'# TYPE {span_metric} summary']
+        for (name, key), stats in sorted(self.summary().items()):
+            labels = (('span', name),) + key + const
+            for q in QUANTILES:
+                lines.append(f'{span_metric}{_format_labels(labels, quantile=q)} {stats[f"p{int(q * 100)}"]:.6f}')
+            lines.append(f'{span_metric}_sum{_format_labels(labels)} {stats["sum"]:.6f}')
+            lines.append(f'{span_metric}_count{_format_labels(labels)} {stats["count"]}')
+        typed = set()
+        for (name, key), value in sorted(self.gauges().items()):
+            metric = f'{METRIC_PREFIX}_{name}'
+            if metric not in typed:
+                lines.append(f'# TYPE {metric} gauge')
+                typed.add(metric)
+            lines.append(f'{metric}{_format_labels(key + const)} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path):
+        """Ghi metrics của tiến trình này ra process_textfile(path), nhãn pid, ghi nguyên tử để
+        collector (vd. node_exporter textfile) không đọc phải file ghi dở. Trả về đường dẫn đã ghi."""
+        path = process_textfile(path)
+        write_text(path, self.prometheus_text(pid=os.getpid()))
+        if path not in _textfiles:
+            _textfiles.add(path)
+            atexit.register(_remove_quietly, path)
+        return path
+
+
+def process_textfile(path):
+    """File metrics riêng của tiến trình: metrics.prom -> metrics.<pid>.prom. Nhiều tiến trình
+    Streamlit ghi cùng một cấu hình thì mỗi tiến trình một file, không ghi đè số liệu của nhau."""
+    root, ext = os.path.splitext(path)
+    return f"{root}.{os.getpid()}{ext}"
+
+
+_textfiles = set()
+
+
+def _remove_quietly(path):
+    # Tiến trình kết thúc: bỏ file của nó để collector không giữ số liệu cũ
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class _Span:
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+def frame_memory_bytes(df):
+    # Không dùng deep=True: frame là view trên file memory-map, đếm sâu sẽ chạm vào mọi trang
+    return int(df.memory_usage(index=True, deep=False).sum())
+
+
+def frame_memory_report(df):
+    """Bộ nhớ từng cột của frame: dtype, tổng byte và byte/dòng.
+
+    Cột object được đếm sâu (mỗi giá trị là một đối tượng Python riêng); cột số chỉ tính nbytes
+    nên không chạm vào trang nhớ của file memory-map.
+    """
+    rows = max(len(df), 1)
+    report = []
+    for col in df.columns:
+        values = df[col]
+        nbytes = int(values.memory_usage(index=False, deep=values.dtype.kind == 'O'))
+        report.append((col, str(values.dtype), nbytes, nbytes / rows))
+    return pd.DataFrame(report, columns=['column', 'dtype', 'bytes', 'bytes_per_row'])
+
+
+def _proc_status_bytes(field):
+    # Linux: /proc/self/status có VmHWM (đỉnh RSS, đặt lại được qua clear_refs)
+    try:
+        with open('/proc/self/status', 'r', encoding='ascii') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss():
+    """Đặt lại đỉnh RSS về RSS hiện tại để đo đỉnh của từng bước; False nếu hệ điều hành không hỗ trợ."""
+    try:
+        with open('/proc/self/clear_refs', 'w', encoding='ascii') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_bytes():
+    peak = _proc_status_bytes('VmHWM')
+    if peak is not None:
+        return peak
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux trả về KB, macOS trả về byte
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+REGISTRY = Metrics()
+span = REGISTRY.span
+timed = REGISTRY.timed
@@ -0,0 +1,345 @@
+"""Dịch vụ truy vấn dữ liệu thời tiết qua HTTP/JSON, dùng chung cache cho dashboard và các job cảnh báo.
+
+Ví dụ:
+    python query_service.py "output_from_grib.csv" --forecast "predictions.csv" --port 8765
+    python query_service.py --regions regions.json --region hanoi --port 8765
+    curl "http://127.0.0.1:8765/historical/monthly?lat=21.0&lon=105.75&year=2023"
+
+Các endpoint (GET, tham số qua query string):
+    /health
+    /historical/monthly   lat, lon, year
+    /historical/daily     lat, lon, year, month
+    /historical/series    lat, lon, start, end, fields (vd. t2m,tp)
+    /forecast/runs
+    /forecast/series      run (mặc định lượt mới nhất), lat, lon, date
+    /forecast/alerts      run, lat, lon, date, interpolate (0/1)
+    /forecast/sites       run, lats, lons (danh sách cách nhau bởi dấu phẩy), date
+    /forecast/alerts/summary  run, min_level
+    /metrics              thời gian truy vấn và bộ nhớ (định dạng Prometheus)
+
+Xử lý chạy trên thread pool để event loop không bị chặn; các request giống hệt nhau đang chạy
+dở được gộp lại, chỉ tính một lần. Mỗi tiến trình phục vụ một vùng (xem regions.py), dùng chung
+store và các lượt dự báo với dashboard.
+"""
+import os
+import json
+import asyncio
+import argparse
+import threading
+import urllib.parse
+import urllib.request
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import data_store
+import rollups
+import alerts
+import metrics
+from grid_index import GridIndex
+from forecast_store import ForecastStore
+import regions
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+HTTP_STATUS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               500: 'Internal Server Error'}
+
+
+class QueryEngine:
+    """Các truy vấn đồng bộ trên store đã ingest; dữ liệu được nạp một lần rồi giữ ấm trong tiến trình."""
+
+    def __init__(self, historical_csv, forecast_store=None, store_dir=data_store.STORE_DIR,
+                 region=regions.DEFAULT_REGION):
+        self.historical_csv = historical_csv
+        self.store_dir = store_dir
+        self.region = region
+        # Cùng thư mục lượt dự báo của vùng mà app dùng, để id lượt của app hợp lệ ở đây
+        self.forecast_store = forecast_store or ForecastStore(regions.forecast_runs_dir(region, store_dir))
+        self._lock = threading.Lock()
+        self._rollups = None
+        self.forecast_index = lru_cache(maxsize=8)(self._forecast_index)
+        self.forecast_alerts = lru_cache(maxsize=8)(self._forecast_alerts)
+
+    def _load_rollups(self):
+        with self._lock:
+            if self._rollups is None:
+                self._rollups = data_store.load_rollups(self.historical_csv, self.store_dir)
+            return self._rollups
+
+    def _forecast_index(self, run_id):
+        return GridIndex(self.forecast_store.load_run(run_id))
+
+    def _forecast_alerts(self, run_id):
+        return alerts.evaluate_alerts(self.forecast_index(run_id).frame)
+
+    def _run(self, run_id):
+        run_id = run_id or self.forecast_store.latest()
+        if run_id is None or run_id not in self.forecast_store.runs():
+            raise ValueError(f"Unknown forecast run: {run_id}")
+        return run_id
+
+    def monthly_stats(self, lat, lon, year):
+        monthly_cube, _ = self._load_rollups()
+        return rollups.monthly_stats(monthly_cube, lat, lon, year)
+
+    def daily_stats(self, lat, lon, year, month):
+        _, daily_cube = self._load_rollups()
+        return rollups.daily_stats(daily_cube, lat, lon, year, month)
+
+    def historical_series(self, lat, lon, start, end, fields):
+        # Chỉ đọc các phân vùng và ô lưới cần thiết
+        df = data_store.load_historical(self.historical_csv, self.store_dir, start=start, end=end, lat=lat, lon=lon)
+        return df.sort_values('time')[['time'] + [f for f in fields if f in df.columns]]
+
+    def forecast_runs(self):
+        return self.forecast_store.runs()
+
+    def forecast_series(self, run_id, lat, lon, date):
+        return self.forecast_index(self._run(run_id)).point_date(lat, lon, date)
+
+    def forecast_point_alerts(self, run_id, lat, lon, date, interpolate=False):
+        """{metric: (giá trị, chỉ số rule trong ALERT_RULES hoặc None)}."""
+        cube = self.forecast_alerts(self._run(run_id))
+        return {
+            name: (value, cube.rules.index(rule) if rule is not None else None)
+            for name, (value, rule) in cube.point(lat, lon, date, interpolate).items()
+        }
+
+    def forecast_sites(self, run_id, lats, lons, date):
+        return self.forecast_alerts(self._run(run_id)).sites(lats, lons, date)
+
+    def alert_summary(self, run_id, min_level=alerts.WARNING):
+        return self.forecast_alerts(self._run(run_id)).to_frame(min_level)
+
+
+def _frame_json(df):
+    # Cột ngày (object) đổi sang chuỗi ISO; NaN thành null
+    df = df.copy()
+    for column in df.columns:
+        if df[column].dtype == object:
+            df[column] = df[column].astype(str)
+    return df.to_json(orient='records', date_format='iso')
+
+
+def encode_result(result):
+    if isinstance(result, pd.DataFrame):
+        return _frame_json(result).encode('utf-8')
+
+    def default(value):
+        if isinstance(value, np.generic):
+            return value.item()
+        return str(value)
+
+    def clean(value):
+        if isinstance(value, float) and np.isnan(value):
+            return None
+        if isinstance(value, (list, tuple)):
+            return [clean(v) for v in value]
+        if isinstance(value, dict):
+            return {k: clean(v) for k, v in value.items()}
+        return value
+
+    return json.dumps(clean(result), default=default, ensure_ascii=False).encode('utf-8')
+
+
+def _coordinates(params):
+    return float(params['lat']), float(params['lon'])
+
+
+def _float_list(value):
+    return [float(v) for v in value.split(',') if v]
+
+
+def build_routes(engine):
+    """path -> hàm(params) trả về kết quả cần mã hóa."""
+    return {
+        '/health': lambda p: {'status': 'ok'},
+        '/historical/monthly': lambda p: engine.monthly_stats(*_coordinates(p), int(p['year'])),
+        '/historical/daily': lambda p: engine.daily_stats(*_coordinates(p), int(p['year']), int(p['month'])),
+        '/historical/series': lambda p: engine.historical_series(
+            *_coordinates(p), pd.Timestamp(p['start']), pd.Timestamp(p['end']),
+            p.get('fields', ','.join(data_store.MEASUREMENT_COLUMNS)).split(',')),
+        '/forecast/runs': lambda p: engine.forecast_runs(),
+        '/forecast/series': lambda p: engine.forecast_series(p.get('run'), *_coordinates(p), pd.Timestamp(p['date'])),
+        '/forecast/alerts': lambda p: engine.forecast_point_alerts(
+            p.get('run'), *_coordinates(p), pd.Timestamp(p['date']), p.get('interpolate', '0') == '1'),
+        '/forecast/sites': lambda p: engine.forecast_sites(
+            p.get('run'), _float_list(p['lats']), _float_list(p['lons']), pd.Timestamp(p['date'])),
+        '/forecast/alerts/summary': lambda p: engine.alert_summary(
+            p.get('run'), int(p.get('min_level', alerts.WARNING))),
+    }
+
+
+class QueryService:
+    """Server HTTP/JSON trên asyncio; truy vấn chạy trong thread pool, request trùng nhau được gộp."""
+
+    def __init__(self, engine, host=DEFAULT_HOST, port=DEFAULT_PORT, workers=4):
+        self.engine = engine
+        self.host = host
+        self.port = port
+        self.routes = build_routes(engine)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='query')
+        self._inflight = {}
+        self.requests = 0
+        self.coalesced = 0
+
+    def _compute(self, handler, params):
+        # Mã hóa JSON cũng chạy trong thread pool, kết quả bytes được chia sẻ cho mọi request gộp
+        return encode_result(handler(params))
+
+    async def query(self, path, params):
+        """(status, body) cho một request; các request (path, params) giống nhau đang chạy dùng chung kết quả."""
+        handler = self.routes.get(path)
+        if handler is None:
+            return 404, encode_result({'error': f"Unknown endpoint: {path}"})
+        self.requests += 1
+        key = (path, tuple(sorted(params.items())))
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().run_in_executor(self.executor, self._compute, handler, params)
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        metrics.REGISTRY.set_gauge('query_requests', self.requests)
+        metrics.REGISTRY.set_gauge('query_coalesced', self.coalesced)
+        try:
+            # shield: một client ngắt kết nối không hủy kết quả mà các request khác đang chờ
+            with metrics.span('query', endpoint=path):
+                return 200, await asyncio.shield(future)
+        except KeyError as e:
+            return 400, encode_result({'error': f"Missing parameter: {e.args[0]}"})
+        except (ValueError, TypeError) as e:
+            return 400, encode_result({'error': f"Bad request: {e}"})
+        except Exception as e:
+            return 500, encode_result({'error': str(e)})
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode('latin-1').strip()
+            # Bỏ qua header, chỉ hỗ trợ GET không có body
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request_line.split(' ')
+            content_type = 'application/json; charset=utf-8'
+            if len(parts) != 3:
+                status, body = 400, encode_result({'error': 'Malformed request line'})
+            elif parts[0] != 'GET':
+                status, body = 405, encode_result({'error': f"Method not allowed: {parts[0]}"})
+            else:
+                url = urllib.parse.urlsplit(parts[1])
+                if url.path == '/metrics':
+                    status, body = 200, metrics.REGISTRY.prometheus_text().encode('utf-8')
+                    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+                else:
+                    status, body = await self.query(url.path, dict(urllib.parse.parse_qsl(url.query)))
+            writer.write(
+                f"HTTP/1.1 {status} {HTTP_STATUS[status]}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode('latin-1') + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self):
+        server = await asyncio.start_server(self._handle, self.host, self.port)
+        print(f"Query service listening on http://{self.host}:{self.port}", flush=True)
+        async with server:
+            await server.serve_forever()
+
+
+class QueryClient:
+    """Client đồng bộ cho QueryService; trả về cùng kiểu dữ liệu như các hàm trong rollups/alerts."""
+
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def _get(self, path, **params):
+        query = urllib.parse.urlencode({k: v for k, v in params.items() if v is not None})
+        with urllib.request.urlopen(f"{self.base_url}{path}?{query}", timeout=self.timeout) as response:
+            return json.loads(response.read().decode('utf-8'))
+
+    def monthly_stats(self, lat, lon, year):
+        stats = pd.DataFrame(self._get('/historical/monthly', lat=lat, lon=lon, year=year),
+                             columns=['month', 'max_temp', 'min_temp', 'total_precip', 'month_label'])
+        return stats.astype({'month': np.int64})
+
+    def daily_stats(self, lat, lon, year, month):
+        stats = pd.DataFrame(self._get('/historical/daily', lat=lat, lon=lon, year=year, month=month),
+                             columns=['date', 'max_temp', 'min_temp', 'total_precip'])
+        stats['date'] = pd.to_datetime(stats['date']).dt.date
+        return stats
+
+    def historical_series(self, lat, lon, start, end, fields):
+        series = pd.DataFrame(self._get('/historical/series', lat=lat, lon=lon, start=pd.Timestamp(start).isoformat(),
+                                        end=pd.Timestamp(end).isoformat(), fields=','.join(fields)))
+        if 'time' in series.columns:
+            series['time'] = pd.to_datetime(series['time'])
+        return series
+
+    def forecast_runs(self):
+        return self._get('/forecast/runs')
+
+    def forecast_alerts(self, run_id, lat, lon, date, interpolate=False):
+        """{metric: (giá trị, AlertRule hoặc None)} như AlertCube.point."""
+        result = self._get('/forecast/alerts', run=run_id, lat=lat, lon=lon, date=pd.Timestamp(date).date().isoformat(),
+                           interpolate=int(interpolate))
+        return {
+            name: (np.nan if value is None else value, alerts.ALERT_RULES[rule_id] if rule_id is not None else None)
+            for name, (value, rule_id) in result.items()
+        }
+
+    def forecast_sites(self, run_id, lats, lons, date):
+        """Bảng chỉ số nội suy và mức cảnh báo tại nhiều tọa độ, như AlertCube.sites."""
+        return pd.DataFrame(self._get('/forecast/sites', run=run_id, lats=','.join(map(str, lats)),
+                                      lons=','.join(map(str, lons)), date=pd.Timestamp(date).date().isoformat()))
+
+    def alert_summary(self, run_id=None, min_level=alerts.WARNING):
+        summary = pd.DataFrame(self._get('/forecast/alerts/summary', run=run_id, min_level=min_level),
+                               columns=['date', 'latitude', 'longitude', 'level'])
+        summary['date'] = pd.to_datetime(summary['date']).dt.date
+        return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve weather queries over HTTP/JSON.')
+    parser.add_argument('csv_path', nargs='?', help='historical ERA5 CSV exported from GRIB (default: from --regions)')
+    parser.add_argument('--forecast', nargs='*', default=[], help='forecast CSV files to ingest at startup')
+    parser.add_argument('--regions', help='JSON list of regions (see regions.py)')
+    parser.add_argument('--region', default=regions.DEFAULT_REGION, help='key of the region to serve')
+    parser.add_argument('--store-dir', default=data_store.STORE_DIR)
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--workers', type=int, default=4, help='query worker threads')
+    args = parser.parse_args()
+
+    if args.regions:
+        region = next((r for r in regions.load_regions(args.regions) if r.key == args.region), None)
+        if region is None:
+            parser.error(f"region {args.region!r} not found in {args.regions}")
+    else:
+        region = regions.Region(args.region, args.region, None, None, None, regions.DEFAULT_WATCH_PATTERN)
+    csv_path = args.csv_path or region.historical_csv
+    if not csv_path:
+        parser.error('csv_path is required without --regions')
+    forecasts = list(args.forecast)
+    if not forecasts and region.forecast_csv and os.path.exists(region.forecast_csv):
+        forecasts = [region.forecast_csv]
+
+    engine = QueryEngine(csv_path, regions.forecast_store(region, args.store_dir), args.store_dir, region.key)
+    for forecast_csv in forecasts:
+        engine.forecast_store.ingest(forecast_csv)
+    # Dựng store (nếu chưa có) trước khi nhận request
+    data_store.historical_manifest(csv_path, args.store_dir)
+    asyncio.run(QueryService(engine, args.host, args.port, args.workers).serve())
+
+
+if __name__ == '__main__':
+    main()
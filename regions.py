@@ -0,0 +1,118 @@
+"""Danh sách vùng (tỉnh/thành), mỗi vùng có file ERA5 lịch sử và các file dự báo riêng.
+
+Ví dụ:
+    python regions.py regions.json --workers 4
+
+regions.json là danh sách các vùng:
+    [{"key": "hanoi", "name": "Hà Nội", "historical": "era5_hanoi.csv",
+      "forecast": "predictions_hanoi.csv", "watch_dir": "du_bao/hanoi"}, ...]
+
+Mọi vùng dùng chung một store: dữ liệu lịch sử của mỗi vùng là một thư mục phân vùng theo năm/tháng
+(khóa theo hash file nguồn), các lượt dự báo nằm trong forecast_runs/<key>. Lệnh trên ingest trước
+mọi vùng song song, mỗi vùng một tiến trình; app chỉ dựng store của một vùng khi section đầu tiên cần tới.
+"""
+import os
+import json
+import argparse
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+import data_store
+import metrics
+from forecast_store import ForecastStore
+
+Region = namedtuple('Region', ['key', 'name', 'historical_csv', 'forecast_csv', 'watch_dir', 'watch_pattern'])
+DEFAULT_WATCH_PATTERN = 'predictions_*.csv'
+# Vùng mặc định khi chỉ cấu hình một bộ file (app không có WEATHER_REGIONS, query_service không có --regions)
+DEFAULT_REGION = 'hanoi'
+# Các cột cần cho so sánh cảnh báo giữa các vùng
+COMPARISON_COLUMNS = ['time', 'latitude', 'longitude'] + data_store.MEASUREMENT_COLUMNS
+
+
+def load_regions(path):
+    """Đọc danh sách vùng từ file JSON; đường dẫn tương đối tính từ thư mục của file."""
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+
+    def resolve(value):
+        return os.path.join(base, value) if value else None
+
+    result = []
+    for entry in entries:
+        result.append(Region(entry['key'], entry.get('name', entry['key']), resolve(entry.get('historical')),
+                             resolve(entry.get('forecast')), resolve(entry.get('watch_dir')),
+                             entry.get('watch_pattern', DEFAULT_WATCH_PATTERN)))
+    keys = [region.key for region in result]
+    if len(set(keys)) != len(keys):
+        raise ValueError(f"Duplicate region keys in {path}")
+    return result
+
+
+def forecast_runs_dir(key, store_dir=data_store.STORE_DIR):
+    return os.path.join(store_dir, 'forecast_runs', key)
+
+
+def forecast_store(region, store_dir=data_store.STORE_DIR):
+    return ForecastStore(forecast_runs_dir(region.key, store_dir))
+
+
+def ingest_region(region, store_dir=data_store.STORE_DIR):
+    """Dựng store lịch sử và ingest file dự báo của một vùng (bỏ qua phần đã có)."""
+    result = {'key': region.key, 'cells': None, 'run': None}
+    if region.historical_csv and os.path.exists(region.historical_csv):
+        manifest = data_store.historical_manifest(region.historical_csv, store_dir)
+        result['cells'] = len(manifest['latitudes']) * len(manifest['longitudes'])
+    if region.forecast_csv and os.path.exists(region.forecast_csv):
+        result['run'] = forecast_store(region, store_dir).ingest(region.forecast_csv)
+    return result
+
+
+@metrics.timed('ingest_regions')
+def ingest_regions(regions, store_dir=data_store.STORE_DIR, workers=None):
+    """Ingest mọi vùng, mỗi vùng một tiến trình; trả về {key: kết quả của ingest_region}."""
+    workers = min(workers or os.cpu_count() or 1, len(regions))
+    if workers <= 1:
+        return {region.key: ingest_region(region, store_dir) for region in regions}
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(ingest_region, region, store_dir) for region in regions]
+        for future in as_completed(futures):
+            result = future.result()
+            results[result['key']] = result
+    return {region.key: results[region.key] for region in regions}
+
+
+def latest_forecasts(regions, store_dir=data_store.STORE_DIR):
+    """Lượt dự báo mới nhất của mọi vùng nối thành một frame, thêm cột region (categorical)."""
+    frames, codes = [], []
+    for code, region in enumerate(regions):
+        store = forecast_store(region, store_dir)
+        run_id = store.latest()
+        if run_id is None:
+            continue
+        frame = store.load_run(run_id)
+        frames.append(frame[[c for c in COMPARISON_COLUMNS if c in frame.columns]])
+        codes.append(np.full(len(frame), code, dtype=np.int16))
+    if not frames:
+        return pd.DataFrame(columns=COMPARISON_COLUMNS + ['region'])
+    df = pd.concat(frames, ignore_index=True)
+    df['region'] = pd.Categorical.from_codes(np.concatenate(codes), categories=[r.key for r in regions])
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ingest historical and forecast CSVs of many regions in parallel.')
+    parser.add_argument('regions_file', help='JSON list of regions')
+    parser.add_argument('--store-dir', default=data_store.STORE_DIR)
+    parser.add_argument('--workers', type=int, default=None, help='ingest processes (default: CPU count)')
+    args = parser.parse_args()
+    for key, result in ingest_regions(load_regions(args.regions_file), args.store_dir, args.workers).items():
+        print(f"{key}: {result['cells'] or 0} cells, forecast run {result['run'] or '-'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from grid_index import GridLocator
+
+ROLLUP_FIELDS = ['t2m', 'msl', 'tp', 'u10', 'v10']
+
+
+class RollupCube:
+    """Thống kê max/min/sum/mean theo ô lưới, lưu dạng mảng (time_bucket, lat, lon).
+
+    freq='D' gộp theo ngày, 'W' theo tuần (bắt đầu thứ Hai), 'M' theo tháng. Có thể cập nhật dần
+    bằng update() khi có dữ liệu mới (vd. từng chunk khi ingest). Bộ nhớ tỉ lệ với số bucket nhân số
+    ô lưới; trục thời gian được cấp phát dư gấp đôi nên khoảng thời gian tăng dần chỉ chép lại mảng
+    khoảng log(số bucket) lần.
+    """
+
+    def __init__(self, freq, fields=ROLLUP_FIELDS):
+        if freq not in ('D', 'W', 'M'):
+            raise ValueError(f"Unsupported rollup frequency: {freq}")
+        self.freq = freq
+        self.fields = list(fields)
+        self.lats = np.array([], dtype=np.float64)
+        self.lons = np.array([], dtype=np.float64)
+        self.origin = 0
+        self.n_buckets = 0
+        self._sum = {}
+        self._count = {}
+        self._max = {}
+        self._min = {}
+        # Mảng cấp phát khi cập nhật dần: (thống kê, field) -> (sức chứa, lat, lon), bucket đầu là _base
+        self._buffers = {}
+        self._base = 0
+        self._capacity = 0
+
+    @classmethod
+    def from_frame(cls, df, freq, fields=ROLLUP_FIELDS):
+        cube = cls(freq, [f for f in fields if f in df.columns])
+        cube.update(df)
+        return cube
+
+    def bucket_of(self, times):
+        times = pd.DatetimeIndex(times)
+        if self.freq == 'D':
+            return times.values.astype('datetime64[D]').astype(np.int64)
+        if self.freq == 'W':
+            # 1970-01-01 là thứ Năm; +3 để tuần bắt đầu từ thứ Hai
+            return (times.values.astype('datetime64[D]').astype(np.int64) + 3) // 7
+        return times.year.to_numpy(np.int64) * 12 + times.month.to_numpy(np.int64) - 1
+
+    def bucket_start(self, buckets):
+        """Thời điểm bắt đầu (datetime64[D]) của các bucket."""
+        buckets = np.asarray(buckets, dtype=np.int64)
+        if self.freq == 'D':
+            return buckets.astype('datetime64[D]')
+        if self.freq == 'W':
+            return (buckets * 7 - 3).astype('datetime64[D]')
+        # Bucket tháng đếm từ năm 0, datetime64[M] đếm từ 1970-01
+        return (buckets - 1970 * 12).astype('datetime64[M]').astype('datetime64[D]')
+
+    def _grow(self, lats, lons, lo, hi):
+        new_lats = np.union1d(self.lats, lats)
+        new_lons = np.union1d(self.lons, lons)
+        new_origin = min(self.origin, lo) if self.n_buckets else lo
+        new_end = max(self.origin + self.n_buckets, hi + 1) if self.n_buckets else hi + 1
+        same_grid = len(new_lats) == len(self.lats) and len(new_lons) == len(self.lons)
+        if same_grid and new_origin == self.origin and new_end - new_origin == self.n_buckets:
+            return
+        if same_grid and self._base <= new_origin and new_end <= self._base + self._capacity:
+            # Còn chỗ trong mảng đã cấp phát: chỉ mở rộng view
+            self.origin, self.n_buckets = new_origin, new_end - new_origin
+            self._views()
+            return
+
+        # Cấp phát lại với sức chứa gấp đôi theo trục thời gian (CSV theo thứ tự thời gian làm
+        # khoảng bucket tăng ở gần như mọi chunk) và chép dữ liệu cũ vào đúng vị trí
+        n_buckets = new_end - new_origin
+        if n_buckets == self.n_buckets:
+            # Chỉ lưới mở rộng: giữ nguyên trục thời gian
+            capacity, base = self._capacity, self._base
+        else:
+            capacity = max(n_buckets, 2 * self.n_buckets)
+            # Dành chỗ trống về phía khoảng thời gian đang mở rộng
+            base = new_end - capacity if new_origin < self.origin else new_origin
+        shape = (capacity, len(new_lats), len(new_lons))
+        b = np.arange(self.n_buckets) + (self.origin - base)
+        i = np.searchsorted(new_lats, self.lats)
+        j = np.searchsorted(new_lons, self.lons)
+        for name, (store, fill, dtype) in self._stores().items():
+            for field in self.fields:
+                arr = np.full(shape, fill, dtype=dtype)
+                if field in store:
+                    arr[np.ix_(b, i, j)] = store.pop(field)
+                self._buffers[(name, field)] = arr
+        self.lats, self.lons = new_lats, new_lons
+        self.origin, self.n_buckets = new_origin, n_buckets
+        self._base, self._capacity = base, capacity
+        self._views()
+
+    def _stores(self):
+        return {'sum': (self._sum, 0, np.float64), 'count': (self._count, 0, np.int32),
+                'max': (self._max, np.nan, np.float32), 'min': (self._min, np.nan, np.float32)}
+
+    def _views(self):
+        # _sum/_count/_max/_min là view liên tục đúng n_buckets trên mảng có sức chứa lớn hơn
+        start = self.origin - self._base
+        for name, (store, _, _) in self._stores().items():
+            for field in self.fields:
+                store[field] = self._buffers[(name, field)][start:start + self.n_buckets]
+
+    def update(self, df):
+        if df.empty:
+            return self
+        lat = df['latitude'].to_numpy()
+        lon = df['longitude'].to_numpy()
+        buckets = self.bucket_of(df['time'])
+        self._grow(np.unique(lat), np.unique(lon), int(buckets.min()), int(buckets.max()))
+
+        n_lat, n_lon = len(self.lats), len(self.lons)
+        flat = ((buckets - self.origin) * n_lat + np.searchsorted(self.lats, lat)) * n_lon \
+            + np.searchsorted(self.lons, lon)
+        # Chỉ cộng dồn trên khoảng ô mà chunk này chạm tới
+        lo, hi = int(flat.min()), int(flat.max()) + 1
+        for field in self.fields:
+            if field not in df.columns:
+                continue
+            values = df[field].to_numpy(np.float64)
+            ok = ~np.isnan(values)
+            keys, values = flat[ok], values[ok]
+            self._sum[field].reshape(-1)[lo:hi] += np.bincount(keys - lo, weights=values, minlength=hi - lo)
+            self._count[field].reshape(-1)[lo:hi] += np.bincount(keys - lo, minlength=hi - lo).astype(np.int32)
+            grouped = pd.Series(values).groupby(keys)
+            group_max, group_min = grouped.max(), grouped.min()
+            idx = group_max.index.to_numpy()
+            flat_max = self._max[field].reshape(-1)
+            flat_min = self._min[field].reshape(-1)
+            flat_max[idx] = np.fmax(flat_max[idx], group_max.to_numpy(np.float32))
+            flat_min[idx] = np.fmin(flat_min[idx], group_min.to_numpy(np.float32))
+        return self
+
+    def save(self, path):
+        """Ghi mỗi mảng ra một file .npy để có thể memory-map khi nạp."""
+        os.makedirs(path, exist_ok=True)
+        arrays = {'lats': self.lats, 'lons': self.lons}
+        for field in self.fields:
+            arrays[f'sum__{field}'] = self._sum[field]
+            arrays[f'count__{field}'] = self._count[field]
+            arrays[f'max__{field}'] = self._max[field]
+            arrays[f'min__{field}'] = self._min[field]
+        for name, arr in arrays.items():
+            np.save(os.path.join(path, f'{name}.npy'), arr)
+        meta = {'freq': self.freq, 'fields': self.fields, 'origin': self.origin, 'n_buckets': self.n_buckets}
+        with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """Nạp cube đã lưu; mặc định memory-map chỉ đọc để các tiến trình dùng chung trang nhớ."""
+        with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+
+        def read(name):
+            return np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode)
+
+        cube = cls(meta['freq'], meta['fields'])
+        cube.lats, cube.lons = read('lats'), read('lons')
+        cube.origin, cube.n_buckets = meta['origin'], meta['n_buckets']
+        for field in cube.fields:
+            cube._sum[field] = read(f'sum__{field}')
+            cube._count[field] = read(f'count__{field}')
+            cube._max[field] = read(f'max__{field}')
+            cube._min[field] = read(f'min__{field}')
+        return cube
+
+    def _reduce(self, field, stat, key):
+        if stat == 'max':
+            return self._max[field][key]
+        if stat == 'min':
+            return self._min[field][key]
+        total, count = self._sum[field][key], self._count[field][key]
+        if stat == 'sum':
+            return np.where(count > 0, total, np.nan)
+        if stat == 'mean':
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return total / count
+        raise ValueError(f"Unsupported rollup statistic: {stat}")
+
+    def array(self, field, stat):
+        """Mảng dày (time_bucket, lat, lon) của một thống kê."""
+        return self._reduce(field, stat, Ellipsis)
+
+    def _cell(self, lat, lon):
+        return GridLocator(self.lats, self.lons).cell(lat, lon)
+
+    def point_stats(self, lat, lon, start, end, columns):
+        """Thống kê của ô (lat, lon) cho các bucket trong [start, end).
+
+        columns: {tên cột: (field, stat)}. Chỉ giữ các bucket có dữ liệu.
+        """
+        cell = self._cell(lat, lon)
+        b0 = max(int(self.bucket_of([start])[0]) - self.origin, 0)
+        b1 = min(int(self.bucket_of([end])[0]) - self.origin, self.n_buckets)
+        if cell is None or b0 >= b1:
+            return pd.DataFrame(columns=['bucket'] + list(columns))
+        i, j = cell
+        has_data = np.zeros(b1 - b0, dtype=bool)
+        data = {}
+        for name, (field, stat) in columns.items():
+            data[name] = self._reduce(field, stat, (slice(b0, b1), i, j))
+            has_data |= self._count[field][b0:b1, i, j] > 0
+        result = pd.DataFrame({'bucket': np.arange(b0, b1) + self.origin, **data})
+        return result[has_data].reset_index(drop=True)
+
+    def slice(self, field, stat, time):
+        """Lưới 2-D (lat, lon) tại bucket chứa thời điểm time."""
+        b = int(self.bucket_of([time])[0]) - self.origin
+        if b < 0 or b >= self.n_buckets:
+            return np.full((len(self.lats), len(self.lons)), np.nan, dtype=np.float32)
+        return self._reduce(field, stat, b)
+
+
+@metrics.timed('monthly_stats')
+def monthly_stats(cube, lat, lon, year):
+    # Max/min nhiệt độ và tổng lượng mưa (mm) theo tháng tại một điểm
+    stats = cube.point_stats(
+        lat, lon, pd.Timestamp(int(year), 1, 1), pd.Timestamp(int(year) + 1, 1, 1),
+        {'max_temp': ('t2m', 'max'), 'min_temp': ('t2m', 'min'), 'total_precip': ('tp', 'sum')},
+    )
+    stats.insert(0, 'month', stats.pop('bucket') % 12 + 1)
+    stats['total_precip'] = stats['total_precip'] * 1000  # m -> mm
+    # Nhãn tháng đẹp: T1, T2, ...
+    stats['month_label'] = stats['month'].apply(lambda x: f"T{x}")
+    return stats
+
+
+@metrics.timed('daily_stats')
+def daily_stats(cube, lat, lon, year, month):
+    # Max/min nhiệt độ và tổng lượng mưa (mm) theo ngày trong một tháng
+    start = pd.Timestamp(int(year), int(month), 1)
+    stats = cube.point_stats(
+        lat, lon, start, start + pd.offsets.MonthBegin(1),
+        {'max_temp': ('t2m', 'max'), 'min_temp': ('t2m', 'min'), 'total_precip': ('tp', 'sum')},
+    )
+    days = stats.pop('bucket').to_numpy().astype('datetime64[D]')
+    stats.insert(0, 'date', pd.DatetimeIndex(days).date)
+    stats['total_precip'] = stats['total_precip'] * 1000  # m -> mm
+    return stats
@@ -0,0 +1,254 @@
+"""Nạp dump MySQL của bảng support_message vào SQLite và truy vấn các luồng hội thoại theo trang.
+
+Ví dụ:
+    python support_store.py insert_support_message.sql
+
+Dump được đọc theo từng khối (không nạp cả file vào bộ nhớ) và ghi theo lô trong một transaction
+ghi (BEGIN IMMEDIATE) cùng với việc kiểm tra và ghi import_log, nên nhiều tiến trình mở lần đầu cùng
+lúc chỉ nạp một lần.
+Phân trang dùng con trỏ (created_at, message_id) nên trang sau không phải quét lại các trang trước.
+"""
+import os
+import re
+import sqlite3
+import argparse
+from datetime import datetime
+
+import pandas as pd
+
+import data_store
+import metrics
+
+SUPPORT_DB = os.path.join(data_store.STORE_DIR, 'support.sqlite')
+TABLE = 'support_message'
+COLUMNS = ['message_id', 'conversationID', 'message', 'created_at', 'group_id', 'sender_id', 'chat_type', 'receiver_id']
+BATCH_ROWS = 5000
+READ_BLOCK = 1 << 20
+PAGE_SIZE = 50
+# Giây chờ khóa ghi: tiến trình mở sau chờ tiến trình đang nạp dump xong
+IMPORT_TIMEOUT = 600
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS {TABLE} (
+    message_id INTEGER PRIMARY KEY,
+    conversationID INTEGER,
+    message TEXT,
+    created_at TEXT,
+    group_id INTEGER,
+    sender_id INTEGER,
+    chat_type TEXT,
+    receiver_id INTEGER
+);
+CREATE TABLE IF NOT EXISTS import_log (
+    source_hash TEXT PRIMARY KEY,
+    source_path TEXT,
+    rows INTEGER,
+    imported_at TEXT
+);
+"""
+# Tạo sau khi nạp lần đầu để không phải cập nhật index cho từng hàng.
+# message_id là rowid nên đã nằm sẵn trong mọi index, dùng làm khóa phụ khi sắp xếp.
+INDEXES = f"""
+CREATE INDEX IF NOT EXISTS idx_{TABLE}_group_thread ON {TABLE} (chat_type, group_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_{TABLE}_private_thread ON {TABLE} (sender_id, receiver_id, created_at);
+"""
+
+_INSERT_HEADER = re.compile(r"INSERT\s+(?:IGNORE\s+)?INTO\s+`?(\w+)`?\s*(?:\(([^)]*)\)\s*)?VALUES\s*", re.IGNORECASE)
+_VALUE = r"(?:'(?:[^'\\]|\\.|'')*'|[^,()'\s]+)"
+_TUPLE = re.compile(rf"\(\s*({_VALUE}(?:\s*,\s*{_VALUE})*)\s*\)", re.DOTALL)
+_TOKEN = re.compile(rf"\s*({_VALUE})\s*(?:,|$)", re.DOTALL)
+_ESCAPES = {'0': '\0', 'b': '\b', 'n': '\n', 'r': '\r', 't': '\t', 'Z': '\x1a'}
+_ESCAPE = re.compile(r"\\(.)|''", re.DOTALL)
+
+
+def _unescape(text):
+    return _ESCAPE.sub(lambda m: "'" if m.group(1) is None else _ESCAPES.get(m.group(1), m.group(1)), text)
+
+
+def _parse_value(token):
+    if token.startswith("'"):
+        return _unescape(token[1:-1])
+    if token.upper() == 'NULL':
+        return None
+    try:
+        return int(token)
+    except ValueError:
+        return float(token)
+
+
+def _parse_tuple(body):
+    return tuple(_parse_value(m.group(1)) for m in _TOKEN.finditer(body))
+
+
+def parse_dump(path, table=TABLE, block_size=READ_BLOCK):
+    """Sinh từng hàng (dict theo tên cột) trong các câu INSERT vào table của một dump MySQL.
+
+    Đọc file theo khối; các câu lệnh khác (SET, LOCK TABLES, comment...) được bỏ qua.
+    """
+    buf, pos, columns, eof = '', 0, None, False
+    with open(path, 'r', encoding='utf-8') as f:
+        while True:
+            # Bỏ khoảng trắng và dấu phẩy giữa các tuple
+            while pos < len(buf) and (buf[pos].isspace() or (columns is not None and buf[pos] == ',')):
+                pos += 1
+            need_more = pos >= len(buf)
+            if not need_more:
+                if columns is not None and buf[pos] == '(':
+                    m = _TUPLE.match(buf, pos)
+                    if m:
+                        values = _parse_tuple(m.group(1))
+                        if columns is not True:
+                            yield dict(zip(columns, values))
+                        pos = m.end()
+                        continue
+                    need_more = True
+                elif columns is not None and buf[pos] == ';':
+                    columns, pos = None, pos + 1
+                    continue
+                elif buf.startswith('--', pos) or buf.startswith('#', pos):
+                    end = buf.find('\n', pos)
+                    need_more, pos = (True, pos) if end < 0 else (False, end + 1)
+                elif buf.startswith('/*', pos):
+                    end = buf.find('*/', pos)
+                    need_more, pos = (True, pos) if end < 0 else (False, end + 2)
+                else:
+                    m = _INSERT_HEADER.match(buf, pos)
+                    if m:
+                        # columns=True: INSERT vào bảng khác, đọc qua các tuple mà không trả về
+                        names = [c.strip().strip('`') for c in m.group(2).split(',')] if m.group(2) else COLUMNS
+                        columns = names if m.group(1) == table else True
+                        pos = m.end()
+                        continue
+                    end = buf.find(';', pos)
+                    need_more, pos = (True, pos) if end < 0 else (False, end + 1)
+            if need_more:
+                if eof:
+                    if pos < len(buf) and buf[pos:].strip():
+                        raise ValueError(f"Unexpected end of SQL dump near: {buf[pos:pos + 80]!r}")
+                    return
+                block = f.read(block_size)
+                eof = not block
+                buf, pos = buf[pos:] + block, 0
+
+
+def connect(db_path=SUPPORT_DB, timeout=5.0):
+    return sqlite3.connect(db_path, timeout=timeout)
+
+
+@metrics.timed('import_support_dump')
+def import_dump(sql_path, db_path=SUPPORT_DB, batch_rows=BATCH_ROWS):
+    """Nạp dump vào SQLite (bỏ qua nếu đúng nội dung này đã nạp); trả về số hàng đã ghi."""
+    os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+    digest = data_store.source_hash(sql_path, os.path.dirname(db_path) or '.')
+    conn = connect(db_path, timeout=IMPORT_TIMEOUT)
+    try:
+        conn.executescript(SCHEMA)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        # Tự quản lý transaction: kiểm tra import_log, nạp và ghi import_log trong cùng một khóa ghi
+        conn.isolation_level = None
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM import_log WHERE source_hash = ?", (digest,)).fetchone():
+                conn.execute("ROLLBACK")
+                return 0
+            insert = (f"INSERT OR REPLACE INTO {TABLE} ({', '.join(COLUMNS)}) "
+                      f"VALUES ({', '.join('?' * len(COLUMNS))})")
+            rows, batch = 0, []
+            for record in parse_dump(sql_path):
+                batch.append(tuple(record.get(c) for c in COLUMNS))
+                if len(batch) >= batch_rows:
+                    conn.executemany(insert, batch)
+                    rows, batch = rows + len(batch), []
+            conn.executemany(insert, batch)
+            rows += len(batch)
+            # executescript sẽ COMMIT trước khi chạy nên tạo từng index một
+            for statement in filter(str.strip, INDEXES.split(';')):
+                conn.execute(statement)
+            conn.execute("INSERT INTO import_log VALUES (?, ?, ?, ?)",
+                         (digest, os.path.abspath(sql_path), rows, datetime.now().isoformat(timespec='seconds')))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("ANALYZE")
+        return rows
+    finally:
+        conn.close()
+
+
+def _page(db_path, branches, before, limit):
+    """Một trang (mới nhất trước) gộp từ các nhánh (where, params), mỗi nhánh đi theo một index.
+
+    before=(created_at, message_id) là con trỏ của hàng cũ nhất trang trước.
+    """
+    order = "ORDER BY created_at DESC, message_id DESC LIMIT ?"
+    parts, params = [], ()
+    for where, branch_params in branches:
+        if before is not None:
+            where += " AND (created_at < ? OR (created_at = ? AND message_id < ?))"
+            branch_params = branch_params + (before[0], before[0], before[1])
+        parts.append(f"SELECT * FROM (SELECT {', '.join(COLUMNS)} FROM {TABLE} WHERE {where} {order})")
+        params += branch_params + (limit,)
+    query = f"{' UNION ALL '.join(parts)} {order}" if len(parts) > 1 else parts[0]
+    if len(parts) > 1:
+        params += (limit,)
+    conn = connect(db_path)
+    try:
+        return pd.read_sql_query(query, conn, params=params)
+    finally:
+        conn.close()
+
+
+@metrics.timed('support_thread_page')
+def group_thread(group_id, before=None, limit=PAGE_SIZE, db_path=SUPPORT_DB):
+    """Một trang tin nhắn của nhóm, mới nhất trước."""
+    return _page(db_path, [("chat_type = 'GROUP' AND group_id = ?", (group_id,))], before, limit)
+
+
+@metrics.timed('support_thread_page')
+def private_thread(user_a, user_b, before=None, limit=PAGE_SIZE, db_path=SUPPORT_DB):
+    """Một trang tin nhắn riêng giữa hai người (cả hai chiều), mới nhất trước."""
+    # Mỗi chiều là một nhánh đi theo index (sender_id, receiver_id, created_at)
+    where = "chat_type = 'PRIVATE' AND sender_id = ? AND receiver_id = ?"
+    return _page(db_path, [(where, (user_a, user_b)), (where, (user_b, user_a))], before, limit)
+
+
+def next_cursor(page):
+    """Con trỏ để lấy trang tiếp theo (cũ hơn), hoặc None nếu đã hết."""
+    if page.empty:
+        return None
+    last = page.iloc[-1]
+    return last['created_at'], int(last['message_id'])
+
+
+def conversations(db_path=SUPPORT_DB):
+    """Danh sách hội thoại: nhóm (group_id) và cặp nhắn riêng (user_a < user_b), kèm số tin và tin cuối."""
+    conn = connect(db_path)
+    try:
+        groups = pd.read_sql_query(
+            f"SELECT 'GROUP' AS chat_type, group_id, NULL AS user_a, NULL AS user_b, "
+            f"COUNT(*) AS messages, MAX(created_at) AS last_message "
+            f"FROM {TABLE} WHERE chat_type = 'GROUP' GROUP BY group_id", conn)
+        pairs = pd.read_sql_query(
+            f"SELECT 'PRIVATE' AS chat_type, NULL AS group_id, MIN(sender_id, receiver_id) AS user_a, "
+            f"MAX(sender_id, receiver_id) AS user_b, COUNT(*) AS messages, MAX(created_at) AS last_message "
+            f"FROM {TABLE} WHERE chat_type = 'PRIVATE' GROUP BY user_a, user_b", conn)
+    finally:
+        conn.close()
+    return pd.concat([groups, pairs], ignore_index=True).sort_values('last_message', ascending=False,
+                                                                     ignore_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import a MySQL support_message dump into SQLite.')
+    parser.add_argument('sql_path', help='SQL dump with INSERT INTO support_message statements')
+    parser.add_argument('--db', default=SUPPORT_DB, help='SQLite database file')
+    parser.add_argument('--batch-rows', type=int, default=BATCH_ROWS, help='rows per transaction')
+    args = parser.parse_args()
+    rows = import_dump(args.sql_path, args.db, args.batch_rows)
+    print(f"Imported {rows} rows into {args.db}" if rows else f"{args.sql_path} already imported into {args.db}")
+
+
+if __name__ == '__main__':
+    main()
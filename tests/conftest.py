@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def write_era5_csv(path, start='2000-01-01', end='2002-01-01', lats=(20.0, 20.25, 20.5), lons=(105.0, 105.25),
+                   freq='6h', seed=0):
+    """CSV giả lập xuất từ GRIB: mỗi mốc thời gian một dòng cho mỗi ô lưới, đơn vị gốc (Kelvin, mét)."""
+    rng = np.random.default_rng(seed)
+    times = pd.date_range(start, end, freq=freq, inclusive='left')
+    grid = pd.MultiIndex.from_product([times, lats, lons], names=['time', 'latitude', 'longitude']).to_frame(index=False)
+    n = len(grid)
+    season = np.cos(2 * np.pi * grid['time'].dt.dayofyear.to_numpy() / 366)
+    grid['t2m'] = 298.0 - 6.0 * season + rng.normal(0, 2, n)
+    grid['msl'] = 101000.0 + rng.normal(0, 300, n)
+    grid['tp'] = rng.exponential(2e-4, n) * (rng.random(n) < 0.3)
+    grid['u10'] = rng.normal(0, 3, n)
+    grid['v10'] = rng.normal(0, 3, n)
+    grid.to_csv(path, index=False)
+    return path
+
+
+def write_forecast_csv(path, start='2025-01-01', days=10, lats=(20.0, 20.25), lons=(105.0, 105.25), seed=0):
+    """CSV dự báo giả lập với tên cột của mô hình (xem data_store.FORECAST_COLUMNS)."""
+    rng = np.random.default_rng(seed)
+    times = pd.date_range(start, periods=days * 4, freq='6h')
+    grid = pd.MultiIndex.from_product([times, lats, lons], names=['time', 'lat', 'lon']).to_frame(index=False)
+    n = len(grid)
+    grid['2m_temperature'] = 298.0 + rng.normal(0, 2, n)
+    grid['mean_sea_level_pressure'] = 101000.0 + rng.normal(0, 300, n)
+    grid['total_precipitation_6hr'] = rng.exponential(2e-4, n)
+    grid['10m_u_component_of_wind'] = rng.normal(0, 3, n)
+    grid['10m_v_component_of_wind'] = rng.normal(0, 3, n)
+    grid.to_csv(path, index=False)
+    return path
+
+
+@pytest.fixture
+def era5_csv(tmp_path):
+    return write_era5_csv(str(tmp_path / 'era5.csv'))
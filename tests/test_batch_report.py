@@ -0,0 +1,21 @@
+import os
+
+import batch_report
+import data_store
+
+
+def test_done_marker_depends_on_run_parameters(era5_csv, tmp_path):
+    store_dir, out_dir = str(tmp_path / 'store'), str(tmp_path / 'reports')
+    batch_report.run(era5_csv, out_dir, store_dir, years=[2001], monthly=False, workers=1)
+    manifest = data_store.historical_manifest(era5_csv, store_dir)
+    source = data_store.source_hash(era5_csv, store_dir)
+    cells = len(manifest['latitudes']) * len(manifest['longitudes'])
+
+    assert batch_report.pending_cells(manifest, out_dir, batch_report.run_params(source, [2001], False)) == []
+    assert len(batch_report.pending_cells(manifest, out_dir, batch_report.run_params(source))) == cells
+    assert len(batch_report.pending_cells(manifest, out_dir, batch_report.run_params(source, [2001], True))) == cells
+    assert len(batch_report.pending_cells(manifest, out_dir, batch_report.run_params('other', [2001], False))) == cells
+
+    batch_report.run(era5_csv, out_dir, store_dir, monthly=False, workers=1)
+    first = batch_report.cell_dir(out_dir, manifest['latitudes'][0], manifest['longitudes'][0])
+    assert {'yearly_2000.csv', 'yearly_2001.csv'} <= set(os.listdir(first))
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_store
+from climatology import WINDOW_DAYS
+
+
+def _brute_force(df, field, day, hour, lat, lon):
+    """Mẫu của cửa sổ WINDOW_DAYS ngày quanh `day` (theo lịch năm nhuận, vòng qua cuối năm) tại một giờ, một ô."""
+    leap_day = pd.to_datetime({'year': 2000, 'month': df['time'].dt.month, 'day': df['time'].dt.day}).dt.dayofyear - 1
+    distance = (leap_day - day) % 366
+    half = WINDOW_DAYS // 2
+    in_window = (distance <= half) | (distance >= 366 - half)
+    rows = df[in_window & (df['time'].dt.hour == hour) & (df['latitude'] == lat) & (df['longitude'] == lon)]
+    values = np.hypot(rows['u10'], rows['v10']) if field == 'wind' else rows[field]
+    values = values.to_numpy(np.float64)
+    return {'mean': values.mean(), 'std': values.std(ddof=1),
+            'p10': np.percentile(values, 10), 'p50': np.percentile(values, 50), 'p90': np.percentile(values, 90)}
+
+
+# Khối nhỏ hơn một hàng latitude, khối nhiều hàng, và cả lưới trong một khối
+@pytest.mark.parametrize('chunk_rows', [1000, 9000, 50000])
+def test_store_climatology_matches_brute_force(era5_csv, tmp_path, chunk_rows):
+    store_dir = str(tmp_path / 'store')
+    data_store.build_historical_store(era5_csv, store_dir, chunk_rows=chunk_rows)
+    clim = data_store.load_climatology(era5_csv, store_dir)
+    df = data_store.load_historical(era5_csv, store_dir)
+
+    for day, hour, i, j in [(0, 0, 0, 0), (59, 6, 1, 1), (200, 12, 2, 0), (365, 18, 2, 1)]:
+        lat, lon = clim.lats[i], clim.lons[j]
+        h = int(np.searchsorted(clim.hours, hour))
+        for field in ['t2m', 'wind']:
+            expected = _brute_force(df, field, day, hour, lat, lon)
+            for stat, value in expected.items():
+                assert clim._stats[(field, stat)][day, h, i, j] == pytest.approx(value, rel=1e-4, abs=1e-4), \
+                    (field, stat, day, hour, lat, lon)
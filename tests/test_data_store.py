@@ -0,0 +1,41 @@
+import glob
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+import data_store
+
+
+def test_partitions_are_single_batch_files(era5_csv, tmp_path):
+    store_dir = str(tmp_path / 'store')
+    path = data_store.build_historical_store(era5_csv, store_dir, chunk_rows=1000)
+    partitions = glob.glob(os.path.join(path, 'year=*', 'month=*'))
+    assert len(partitions) == 24
+    for partition in partitions:
+        files = os.listdir(partition)
+        assert files == ['part-0.arrow']
+        assert ipc.open_file(pa.memory_map(os.path.join(partition, files[0]))).num_record_batches == 1
+
+
+def test_partition_load_is_zero_copy(era5_csv, tmp_path):
+    store_dir = str(tmp_path / 'store')
+    data_store.build_historical_store(era5_csv, store_dir)
+    data_store.load_historical(era5_csv, store_dir, years=[2000], months=[1])
+
+    before = pa.total_allocated_bytes()
+    df = data_store.load_historical(era5_csv, store_dir, years=[2001], months=[3])
+    # Không copy dữ liệu cột nào; chỉ còn vài chục byte quản lý cho mỗi mảng, không phụ thuộc số dòng
+    assert pa.total_allocated_bytes() - before <= 64 * len(df.columns)
+    assert len(df) == 31 * 4 * 6
+    assert (df['year'] == 2001).all() and (df['month'] == 3).all()
+    assert df.equals(df.sort_values(['latitude', 'longitude', 'time'], ignore_index=True))
+
+
+def test_row_filters_snap_to_grid(era5_csv, tmp_path):
+    store_dir = str(tmp_path / 'store')
+    df = data_store.load_historical(era5_csv, store_dir, start='2000-03-02', end='2000-03-05', lat=20.3, lon=105.1)
+    assert len(df) == 3 * 4
+    assert set(df['latitude']) == {20.25} and set(df['longitude']) == {105.0}
+    assert df['time'].min() == pd.Timestamp('2000-03-02') and df['time'].max() < pd.Timestamp('2000-03-05')
@@ -0,0 +1,29 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from conftest import write_forecast_csv
+from forecast_store import ForecastStore
+
+
+def test_concurrent_ingests_keep_every_source(tmp_path):
+    sources = [write_forecast_csv(str(tmp_path / f'predictions_{k}.csv'), start=f'2025-01-{k + 1:02d}', seed=k)
+               for k in range(8)]
+    store = ForecastStore(str(tmp_path / 'runs'))
+    # Mỗi thread một ForecastStore riêng, như watcher của nhiều tiến trình trên cùng thư mục
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        run_ids = list(pool.map(lambda path: ForecastStore(store.root_dir).ingest(path), sources))
+
+    assert store._read_sources() == {os.path.abspath(p): r for p, r in zip(sources, run_ids)}
+    assert sorted(store.runs()) == sorted(run_ids)
+    assert not [name for name in os.listdir(store.root_dir) if name.endswith('.tmp')]
+
+
+def test_reingest_replaces_previous_run(tmp_path):
+    path = write_forecast_csv(str(tmp_path / 'predictions.csv'))
+    store = ForecastStore(str(tmp_path / 'runs'))
+    first = store.ingest(path)
+    write_forecast_csv(path, seed=1)
+    second = store.ingest(path)
+
+    assert second != first
+    assert store.runs() == [second]
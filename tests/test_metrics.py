@@ -0,0 +1,20 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+
+def test_textfile_is_per_process_and_labelled(tmp_path):
+    registry = metrics.Metrics()
+    registry.observe('load_historical', 0.25)
+    registry.set_gauge('peak_rss_bytes', 1024)
+    target = str(tmp_path / 'weather.prom')
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        written = set(pool.map(lambda _: registry.write_textfile(target), range(200)))
+
+    assert written == {str(tmp_path / f'weather.{os.getpid()}.prom')}
+    assert os.listdir(tmp_path) == [f'weather.{os.getpid()}.prom']
+    text = open(written.pop(), encoding='utf-8').read()
+    assert f'weather_span_seconds_count{{span="load_historical",pid="{os.getpid()}"}} 1' in text
+    assert f'weather_peak_rss_bytes{{pid="{os.getpid()}"}} 1024' in text
@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_store
+import rollups
+
+
+@pytest.mark.parametrize('freq', ['D', 'W', 'M'])
+def test_chunked_updates_match_single_pass(era5_csv, freq):
+    df = data_store.prepare_historical_frame(pd.read_csv(era5_csv))
+    whole = rollups.RollupCube.from_frame(df, freq)
+
+    cube = rollups.RollupCube(freq)
+    chunks = [df.iloc[start:start + 500] for start in range(0, len(df), 500)]
+    # Tiến theo thời gian, rồi lùi về trước, và một chunk đầu chỉ có một phần lưới
+    first = chunks[20]
+    west = first['longitude'] == first['longitude'].min()
+    cube.update(first[west])
+    cube.update(first[~west])
+    for chunk in chunks[21:] + chunks[:20][::-1]:
+        cube.update(chunk)
+
+    assert cube.origin == whole.origin and cube.n_buckets == whole.n_buckets
+    assert cube._capacity < 2 * cube.n_buckets + 1
+    for field in whole.fields:
+        for stat in ('max', 'min'):
+            np.testing.assert_array_equal(cube.array(field, stat), whole.array(field, stat))
+        np.testing.assert_allclose(cube.array(field, 'sum'), whole.array(field, 'sum'), rtol=1e-9)
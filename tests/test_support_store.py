@@ -0,0 +1,39 @@
+import os
+import shutil
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+import support_store
+
+DUMP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'insert_support_message.sql')
+
+
+def _import(args):
+    return support_store.import_dump(*args)
+
+
+def test_concurrent_first_imports_load_once(tmp_path):
+    sql_path = str(tmp_path / 'dump.sql')
+    shutil.copy(DUMP, sql_path)
+    db_path = str(tmp_path / 'support.sqlite')
+
+    with ProcessPoolExecutor(max_workers=4) as pool:
+        counts = list(pool.map(_import, [(sql_path, db_path, 100)] * 4))
+
+    rows = max(counts)
+    assert rows > 0 and sorted(counts) == [0, 0, 0, rows]
+    conn = sqlite3.connect(db_path)
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM import_log").fetchone() == (1,)
+        assert conn.execute(f"SELECT COUNT(*) FROM {support_store.TABLE}").fetchone() == (rows,)
+    finally:
+        conn.close()
+
+
+def test_conversations_of_empty_dump(tmp_path):
+    sql_path = str(tmp_path / 'empty.sql')
+    open(sql_path, 'w').close()
+    db_path = str(tmp_path / 'support.sqlite')
+
+    assert support_store.import_dump(sql_path, db_path) == 0
+    assert support_store.conversations(db_path).empty